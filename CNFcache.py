@@ -0,0 +1,149 @@
+"""An on-disk cache of parsed CNF/GCNF instances for marco_py.
+
+Each cached instance is stored in a single binary .marcoidx file named for
+the hash of the (possibly gzipped) input file's contents.  The file holds
+the header counts and the instance's clause arena (see
+CNFsolvers.ClauseStore) in native byte order, so it can be memory-mapped and
+used directly without parsing or copying.
+
+File layout (all values C ints):
+    magic ("MARCOIDX", 8 bytes), version, nvars, nclauses, n, nlits, 0 (padding)
+    lits[nlits], clause_offs[nclauses+1], group_offs[n+2]
+"""
+import array
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+
+_MAGIC = b"MARCOIDX"
+_VERSION = 1
+_HEADER = struct.Struct("=8s6i")
+_INTSIZE = array.array('i').itemsize
+
+
+def file_hash(filename, blocksize=1 << 20):
+    """Return a hex digest of the contents of the given file."""
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+class InstanceCache(object):
+    """A directory of cached, pre-parsed instances with a cap on its total
+    size.  When storing a new instance pushes the cache over its cap, the
+    least recently used entries are evicted.
+    """
+    suffix = '.marcoidx'
+
+    def __init__(self, cachedir, maxsize):
+        self.cachedir = cachedir
+        self.maxsize = maxsize  # in bytes
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+
+    def key(self, filename):
+        return file_hash(filename)
+
+    def path(self, key):
+        return os.path.join(self.cachedir, key + self.suffix)
+
+    def load(self, key):
+        """Load a cached instance.
+
+        Returns:
+            None if the instance is not cached (or its entry is unreadable).
+            Otherwise, a tuple (nvars, nclauses, n, (lits, clause_offs,
+            group_offs)) with the arrays backed by a (copy-on-write) view of
+            the memory-mapped cache file.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if len(mm) < _HEADER.size:
+            return None
+        magic, version, nvars, nclauses, n, nlits, _ = _HEADER.unpack_from(mm, 0)
+        sizes = (nlits, nclauses + 1, n + 2)
+        if magic != _MAGIC or version != _VERSION or len(mm) != _HEADER.size + _INTSIZE * sum(sizes):
+            return None
+
+        # mark the entry as recently used (for eviction)
+        os.utime(path, None)
+
+        arrays = []
+        offset = _HEADER.size
+        for size in sizes:
+            arrays.append(self._int_view(mm, offset, size))
+            offset += _INTSIZE * size
+
+        return nvars, nclauses, n, tuple(arrays)
+
+    @staticmethod
+    def _int_view(mm, offset, size):
+        """Get a view of size C ints in mm starting at offset."""
+        try:
+            return memoryview(mm)[offset:offset + _INTSIZE * size].cast('i')
+        except (AttributeError, TypeError):
+            # Python 2: no memoryview.cast(), so fall back to a copy
+            a = array.array('i')
+            a.fromstring(mm[offset:offset + _INTSIZE * size])
+            return a
+
+    def store(self, key, nvars, nclauses, n, clauses):
+        """Write an instance and its clause arena into the cache, then
+        evict old entries if needed to stay within the size cap."""
+        lits, clause_offs, group_offs = clauses
+        header = _HEADER.pack(_MAGIC, _VERSION, nvars, nclauses, n, len(lits), 0)
+        size = len(header) + _INTSIZE * (len(lits) + len(clause_offs) + len(group_offs))
+        if size > self.maxsize:
+            return
+
+        # write to a temporary file and rename it into place, so concurrent
+        # readers never see a partial entry
+        fd, tmpname = tempfile.mkstemp(dir=self.cachedir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                for a in clauses:
+                    # (Python 2's array has tostring() in place of tobytes())
+                    f.write(a.tobytes() if hasattr(a, 'tobytes') else a.tostring())
+            os.rename(tmpname, self.path(key))
+        except (IOError, OSError):
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its cap."""
+        entries = []
+        for name in os.listdir(self.cachedir):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cachedir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxsize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
@@ -1,17 +1,290 @@
+import array
 import atexit
-import bisect
 import collections
 import gzip
+import io
 import os
 import re
 import subprocess
-import tempfile
+import threading
 import utils
 from pyminisolvers import minisolvers
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+# A parsed CNF/GCNF instance: its header counts and its clause arena,
+# clauses = (lits, clause_offs, group_offs) as described in ClauseStore.
+Instance = collections.namedtuple('Instance', ['nvars', 'nclauses', 'n', 'clauses'])
+
+
+def read_instance(infile, native_parse=True, cache=None):
+    """Parse a CNF/GCNF input once, returning an Instance from which any
+    number of subset solvers can be built without parsing the input again
+    (e.g., in child processes that inherit it when forked)."""
+    csolver = MinisatSubsetSolver(infile, store_dimacs=True, native_parse=native_parse, cache=cache)
+    return csolver.instance()
+
+
+class ClauseStore(object):
+    """A compact store of the clauses of a CNF/GCNF instance, grouped by constraint.
+
+    All literals are kept in a single array of C ints, with clauses sorted by
+    group (group 0 holds any hard clauses, followed by groups 1 through n).
+    Clause j is lits[clause_offs[j]:clause_offs[j+1]], and group g consists
+    of clauses group_offs[g] through group_offs[g+1]-1.
+    """
+    def __init__(self, lits, clause_offs, group_offs):
+        self.lits = lits
+        self.clause_offs = clause_offs
+        self.group_offs = group_offs
+        self.nclauses = len(clause_offs) - 1
+        self.n = len(group_offs) - 2  # number of soft constraints (groups 1..n)
+
+    @classmethod
+    def from_unsorted(cls, lits, clause_offs, clause_groups, n):
+        """Build a ClauseStore from clauses given in any order (e.g., file
+        order), with clause_groups[j] the group of clause j."""
+        group_offs = array.array('i', [0]) * (n + 2)
+        for g in clause_groups:
+            group_offs[g+1] += 1
+        for g in range(n + 1):
+            group_offs[g+1] += group_offs[g]
+
+        if all(clause_groups[j] <= clause_groups[j+1] for j in range(len(clause_groups) - 1)):
+            # already sorted by group (always the case for plain CNF)
+            return cls(lits, clause_offs, group_offs)
+
+        # stable counting sort of the clauses by group
+        nextpos = group_offs[:-1]
+        order = array.array('i', [0]) * len(clause_groups)
+        for j, g in enumerate(clause_groups):
+            order[nextpos[g]] = j
+            nextpos[g] += 1
+        sorted_lits = array.array('i')
+        sorted_offs = array.array('i', [0])
+        for j in order:
+            sorted_lits.extend(lits[clause_offs[j]:clause_offs[j+1]])
+            sorted_offs.append(len(sorted_lits))
+        return cls(sorted_lits, sorted_offs, group_offs)
+
+    def clause(self, j):
+        """Return the literals of clause j."""
+        return self.lits[self.clause_offs[j]:self.clause_offs[j+1]]
+
+    def group(self, g):
+        """Return the indexes of the clauses in group g."""
+        return range(self.group_offs[g], self.group_offs[g+1])
+
+    def dimacs_line(self, j):
+        """Return clause j as a line of DIMACS text."""
+        return b" ".join(str(x).encode() for x in self.clause(j)) + b" 0\n"
+
+
+class CheckCache(object):
+    """Known results of subset checks, used to answer later checks without
+    a SAT call: any superset of a known unsatisfiable set is unsatisfiable,
+    and any subset of a known satisfiable set is satisfiable.
+
+    The unsat sets and the complements of the sat sets are kept in
+    utils.SubsetIndex instances, so a lookup finds an unsat set within the
+    checked set, or a sat set's complement within its complement, in a
+    single pass over the constraints rather than a scan of the cache.  At
+    most maxsize of each kind are kept, evicting the least recently used.
+    A set checked by the solver is only recorded at the next check, as
+    it's usually replaced by the improved set (the unsat core or sat
+    subset) first.  After each lookup, `hit` holds the cached set that
+    answered it (as a list), or None on a miss.
+
+    >>> cache = CheckCache(6, maxsize=2)
+    >>> stats = utils.Statistics()
+    >>> solve = lambda seed: 3 not in seed
+    >>> cache.check([1, 3, 5], solve, stats), cache.improved(lambda: [3], False)
+    (False, [3])
+    >>> cache.check([2, 3, 4], solve, stats), cache.hit
+    (False, [3])
+    >>> cache.check([1, 2], solve, stats), cache.improved(lambda: [1, 2, 4], True)
+    (True, [1, 2, 4])
+    >>> cache.check([4], solve, stats), cache.check([5, 6], solve, stats), cache.check([1, 2], solve, stats)
+    (True, True, True)
+    >>> cache.check([1, 6], solve, stats), cache.check([5], solve, stats), cache.hit
+    (True, True, None)
+    >>> stats.get_counts()['check_cache_hit'], stats.get_counts()['check_cache_miss']
+    (3, 5)
+    """
+    def __init__(self, n, maxsize):
+        self.n = n
+        self.maxsize = maxsize
+        self._indexes = (utils.SubsetIndex(n), utils.SubsetIndex(n))  # unsat sets, sat sets' complements
+        self._sets = (collections.OrderedDict(), collections.OrderedDict())  # for each, slot -> set, least recently used first
+        self._pending = None  # (set, is_sat) from the last check() that missed, if not recorded yet
+        self.hit = None
+
+    def lookup(self, point):
+        """Look up a set (a utils.Bitset).
+
+        Returns:
+            False or True if the set is known to be unsatisfiable or
+            satisfiable, respectively; otherwise None.
+        """
+        # (each index is given the mask of constraints its sets must avoid)
+        for is_sat, outside in ((False, point.complement().mask), (True, point.mask)):
+            slot = self._indexes[is_sat].find_subset(outside)
+            if slot is not None:
+                sets = self._sets[is_sat]
+                sets[slot] = sets.pop(slot)  # (now the most recently used)
+                self.hit = sets[slot][0]
+                return is_sat
+        self.hit = None
+        return None
+
+    def add(self, point, is_sat):
+        """Record a set (a utils.Bitset) as satisfiable or not.  Assumes no
+        set already recorded implies the same (as is the case after a
+        lookup() of it returned None)."""
+        index, sets = self._indexes[is_sat], self._sets[is_sat]
+        indexed = point.complement() if is_sat else point
+        sets[index.add(indexed)] = (list(point), indexed)
+        if len(sets) > self.maxsize:
+            slot, (_, old) = sets.popitem(last=False)
+            index.remove(slot, old)
+
+    def check(self, seed, solve, stats):
+        """Check a set, calling solve(seed) if the cache can't answer (and
+        recording the result).  Counts hits and misses in stats."""
+        if self._pending is not None:
+            self.add(*self._pending)
+            self._pending = None
+        point = utils.Bitset.from_seed(self.n, seed)
+        is_sat = self.lookup(point)
+        if is_sat is None:
+            stats.increment_counter('check_cache_miss')
+            is_sat = solve(seed)
+            self._pending = (point, is_sat)
+        else:
+            stats.increment_counter('check_cache_hit')
+        return is_sat
+
+    def improved(self, get_seed, is_sat):
+        """Get the unsat core or sat subset for the last check, from the
+        cache if it answered the check, else from get_seed(); in that case,
+        it replaces the checked set to be recorded, as it implies it."""
+        if self.hit is not None:
+            return list(self.hit)
+        seed = get_seed()
+        if self._pending is not None:
+            self._pending = (utils.Bitset.from_seed(self.n, seed), is_sat)
+        return seed
+
+
+class ModelRotator(object):
+    """Recursive model rotation over the clauses in a ClauseStore.
+
+    Given a model that satisfies all hard clauses and every constraint in a
+    set except one constraint g, g is critical (in every MUS of the set).
+    Flipping a variable in one of g's falsified clauses gives a new model;
+    if that model falsifies exactly one other constraint of the set, that
+    constraint is also critical, and the process repeats from it.  This
+    finds critical constraints without any further SAT calls.
+    """
+    def __init__(self, clauses, nvars):
+        self.clauses = clauses
+        self.nvars = nvars
+        self._lits = None  # clause literals, as tuples
+        self._occurs = None  # clause indexes containing each literal (indexed by nvars+lit)
+        self._clause_group = None
+
+    def _build_index(self):
+        nv = self.nvars
+        self._lits = [tuple(self.clauses.clause(j)) for j in range(self.clauses.nclauses)]
+        self._occurs = [[] for _ in range(2*nv + 1)]
+        self._clause_group = array.array('i', [0]) * self.clauses.nclauses
+        for g in range(self.clauses.n + 1):
+            for j in self.clauses.group(g):
+                self._clause_group[j] = g
+                for x in self._lits[j]:
+                    self._occurs[nv + x].append(j)
+
+    def critical(self, model, current, removed):
+        """Find constraints of current proven critical by rotating model.
+
+        Args:
+            model: An array of 0/1 values for the instance's variables that
+                   satisfies the hard clauses and all of current except the
+                   constraints in removed.
+            current: A set of constraints.
+            removed: Constraints of current not necessarily satisfied by model.
+
+        Returns:
+            A set of critical constraints of current.
+        """
+        if self._occurs is None:
+            self._build_index()
+        lits = self._lits
+        occurs = self._occurs
+        clause_group = self._clause_group
+        nv = self.nvars
+
+        # truth value of each literal (indexed by nv+lit)
+        value = bytearray(2*nv + 1)
+        for v, val in enumerate(model):
+            value[nv + (v+1 if val else -v-1)] = 1
+
+        def falsified(j):
+            for x in lits[j]:
+                if value[nv + x]:
+                    return False
+            return True
+
+        start = [j for g in removed for j in self.clauses.group(g) if falsified(j)]
+        groups = set(clause_group[j] for j in start)
+        if len(groups) != 1:
+            return set()
+
+        found = set(groups)
+        stack = [(value, start)]
+        while stack:
+            value, falsified_clauses = stack.pop()
+            # Only a flip satisfying *every* falsified clause (all in the
+            # same, critical constraint) can leave a different constraint
+            # as the only one falsified.
+            candidates = set(lits[falsified_clauses[0]])
+            for j in falsified_clauses[1:]:
+                candidates.intersection_update(lits[j])
+
+            for x in candidates:
+                # flip x's variable, making x true (and -x false)
+                value[nv + x] = 1
+                value[nv - x] = 0
+                new_falsified = []
+                g2 = None
+                for j in occurs[nv - x]:
+                    g = clause_group[j]
+                    if (g == 0 or g in current) and falsified(j):
+                        if g2 is not None and g != g2:
+                            g2 = None
+                            break
+                        g2 = g
+                        new_falsified.append(j)
+                if g2 is not None and g2 != 0 and g2 not in found:
+                    found.add(g2)
+                    stack.append((bytearray(value), new_falsified))
+                value[nv + x] = 0
+                value[nv - x] = 1
+
+        return found
+
 
 class MinisatSubsetSolver(object):
-    def __init__(self, infile, rand_seed=None, store_dimacs=False):
+    shrink_algo = 'deletion'  # or 'dichotomic'
+    model_rotation = False  # requires store_dimacs
+    check_cache = None  # CheckCache, if any
+    harvest = None  # if set, called as harvest(subset, is_sat) with sat subsets found while shrinking and unsat cores found while growing
+
+    def __init__(self, infile, rand_seed=None, store_dimacs=False, native_parse=True, cache=None):
         self.s = minisolvers.MinisatSubsetSolver()
 
         # Initialize random seed and randomize variable activity if seed is given
@@ -20,16 +293,38 @@ class MinisatSubsetSolver(object):
             self.s.set_rnd_init_act(True)
 
         self.store_dimacs = store_dimacs
-        if self.store_dimacs:
-            self.dimacs = []
-            self.groups = collections.defaultdict(list)
+        self.native_parse = native_parse
+        self.cache = cache  # CNFcache.InstanceCache, if any
+        self.clauses = None  # ClauseStore, if store_dimacs
         self.read_dimacs(infile)
         self._msolver = None
+        self._rotator = None
+        self.stats = utils.Statistics()  # replaced by the enumerator's via set_stats()
 
     def set_msolver(self, msolver):
         self._msolver = msolver
 
-    def parse_dimacs(self, f):
+    def set_stats(self, stats):
+        self.stats = stats
+
+    def create_vars(self):
+        self.s.set_varcounts(self.nvars, self.n)
+
+        while self.s.nvars() < self.nvars:
+            # let instance variables do whatever...
+            self.s.new_var()
+        while self.s.nvars() < self.nvars + self.n:
+            # but default relaxation variables to try to *enable*
+            # clauses (to find larger sat subsets and/or hit unsat
+            # sooner)
+            self.s.new_var(True)
+
+    def parse_dimacs(self, f, store=False):
+        if store:
+            lits = array.array('i')
+            clause_offs = array.array('i', [0])
+            clause_groups = array.array('i')
+
         i = 0
         for line in f:
             if line.startswith(b'p'):
@@ -44,16 +339,7 @@ class MinisatSubsetSolver(object):
                 else:
                     self.n = self.nclauses
 
-                self.s.set_varcounts(self.nvars, self.n)
-
-                while self.s.nvars() < self.nvars:
-                    # let instance variables do whatever...
-                    self.s.new_var()
-                while self.s.nvars() < self.nvars + self.n:
-                    # but default relaxation variables to try to *enable*
-                    # clauses (to find larger sat subsets and/or hit unsat
-                    # sooner)
-                    self.s.new_var(True)
+                self.create_vars()
                 continue
 
             if line.startswith(b'c'):
@@ -82,64 +368,177 @@ class MinisatSubsetSolver(object):
             else:
                 self.s.add_clause_instrumented(clause, groupid-1)
 
-            if self.store_dimacs:
-                if gcnf_in:
-                    # need to reform clause without '{x}' group index
-                    self.dimacs.append(b" ".join(str(x).encode() for x in clause) + b" 0\n")
-                    self.groups[groupid].append(i)
-                else:
-                    self.dimacs.append(line + b"\n")
-                    self.groups[groupid] = [i]
+            if store:
+                lits.extend(clause)
+                clause_offs.append(len(lits))
+                clause_groups.append(groupid)
 
             i += 1
 
         assert i == self.nclauses
 
+        if store:
+            self.clauses = ClauseStore.from_unsorted(lits, clause_offs, clause_groups, self.n)
+
     def read_dimacs(self, infile):
-        if infile.name.endswith('.gz'):
+        if isinstance(infile, Instance):
+            # already parsed (e.g., by the parent process in parallel mode)
+            self.load_instance(*infile)
+            return
+
+        if self.cache is not None:
+            key = self.cache.key(infile.name)
+            cached = self.cache.load(key)
+            if cached is not None:
+                self.load_instance(*cached)
+                return
+
+        # the clauses must be kept if they will be written to the cache
+        store = self.store_dimacs or self.cache is not None
+
+        if self.native_parse:
+            # let pyminisolvers read (and decompress, if needed) the whole
+            # file and add all of its clauses itself
+            infile.close()
+            self.nvars, self.nclauses, self.n, clauses = self.s.load_dimacs(infile.name, store=store)
+            if store:
+                self.clauses = ClauseStore(*clauses)
+        elif infile.name.endswith('.gz'):
             # use gzip to decompress
             infile.close()
             with gzip.open(infile.name, 'rb') as gz_f:
-                self.parse_dimacs(gz_f)
+                self.parse_dimacs(gz_f, store)
         else:
             # XXX TODO: using open() here to avoid dupe infile object for parallel branch,
             #           but this breaks reading from stdin.
             # assume plain .cnf and pass through the file object
             with open(infile.name, 'rb') as f:
-                self.parse_dimacs(f)
+                self.parse_dimacs(f, store)
+
+        if self.cache is not None:
+            clauses = (self.clauses.lits, self.clauses.clause_offs, self.clauses.group_offs)
+            self.cache.store(key, self.nvars, self.nclauses, self.n, clauses)
+            if not self.store_dimacs:
+                self.clauses = None
+
+    def load_instance(self, nvars, nclauses, n, clauses):
+        """Set up the solver from an already-parsed instance: its header
+        counts and its clause arena (lits, clause_offs, group_offs) as
+        described in ClauseStore."""
+        self.nvars = nvars
+        self.nclauses = nclauses
+        self.n = n
+        self.create_vars()
+        self.s.add_clause_store(*clauses)
+        if self.store_dimacs:
+            self.clauses = ClauseStore(*clauses)
+
+    def instance(self):
+        """Return the parsed instance (requires store_dimacs)."""
+        clauses = (self.clauses.lits, self.clauses.clause_offs, self.clauses.group_offs)
+        return Instance(self.nvars, self.nclauses, self.n, clauses)
 
     def check_subset(self, seed, improve_seed=False):
-        is_sat = self.s.solve_subset([i-1 for i in seed])
+        if self.check_cache is not None:
+            is_sat = self.check_cache.check(seed, self.solve_subset, self.stats)
+        else:
+            is_sat = self.solve_subset(seed)
         if improve_seed:
             if is_sat:
-                seed = self.s.sat_subset(offset=1)
+                seed = self.sat_subset()
             else:
-                seed = self.s.unsat_core(offset=1)
+                seed = self.unsat_core()
             return is_sat, seed
         else:
             return is_sat
 
+    def solve_subset(self, seed):
+        return self.s.solve_subset(seed, offset=1)
+
+    # check_subset() for a set tried while shrinking, harvesting its sat subset if it's satisfiable
+    def shrink_check(self, seed):
+        is_sat = self.check_subset(seed)
+        if is_sat and self.harvest is not None:
+            self.harvest(self.sat_subset(), True)
+        return is_sat
+
+    # check_subset() for a set tried while growing, harvesting its unsat core if it's unsatisfiable
+    def grow_check(self, seed):
+        is_sat = self.check_subset(seed)
+        if not is_sat and self.harvest is not None:
+            self.harvest(self.unsat_core(), False)
+        return is_sat
+
+    # unsat_core() and sat_subset() assume the last check_subset() was unsat / sat, respectively
+    def unsat_core(self):
+        if self.check_cache is not None:
+            return self.check_cache.improved(lambda: self.s.unsat_core(offset=1), False)
+        return self.s.unsat_core(offset=1)
+
+    def sat_subset(self):
+        if self.check_cache is not None:
+            return self.check_cache.improved(lambda: self.s.sat_subset(offset=1), True)
+        return self.s.sat_subset(offset=1)
+
     def complement(self, aset):
-        return set(range(1, self.n+1)).difference(aset)
+        return utils.Bitset.from_seed(self.n, aset).complement()
 
     def shrink(self, seed):
-        hard = self._msolver.implies()
+        """Shrink an unsatisfiable seed to an MUS.  With a check cache, this
+        and grow() run their checks in Python, so each can use the cache.
+
+        >>> import mapsolvers
+        >>> clauses = (array.array('i', [1, -1, 2, -2, 1, 2]), array.array('i', [0, 1, 2, 3, 4, 6]), array.array('i', [0, 0, 1, 2, 3, 4, 5]))
+        >>> csolver = MinisatSubsetSolver(Instance(2, 5, 5, clauses))
+        >>> csolver.set_msolver(mapsolvers.MinisatMapSolver(5))
+        >>> csolver.check_cache = CheckCache(5, maxsize=16)
+        >>> sorted(csolver.shrink([1, 2, 3, 4, 5])), sorted(csolver.grow([1])), sorted(csolver.shrink([2, 3, 4, 5]))
+        ([3, 4], [1, 3, 5], [3, 4])
+        >>> csolver.stats.get_counts()['check_cache_hit'] > 0
+        True
+        """
+        hard = self._msolver.implied()
+        critical = self.rotate if self.model_rotation else None
+        if self.shrink_algo == 'dichotomic':
+            return utils.dichotomic_shrink(seed, hard, self.shrink_check, self.unsat_core, critical)
+        if self.model_rotation or self.harvest is not None or self.check_cache is not None:
+            return self.deletion_shrink(seed, hard, critical)
+        # deletion-based, with clause-set refinement, all within pyminisolvers
+        return self.s.shrink_subset(seed, hard, offset=1)
+
+    def deletion_shrink(self, seed, hard, critical):
         current = set(seed)
+        hard = set(hard)
         for i in seed:
             if i not in current or i in hard:
-                # May have been "also-removed"
                 continue
             current.remove(i)
-            if not self.check_subset(current):
-                # Remove any also-removed constraints
-                current = set(self.s.unsat_core(offset=1))  # helps a bit
-            else:
+
+            if self.shrink_check(current):
                 current.add(i)
+                # i is critical, and the model may show others are, too
+                if critical is not None:
+                    hard.update(critical(current, [i]))
+            else:
+                current = set(self.unsat_core())
+
         return current
 
+    def rotate(self, current, removed):
+        """Return constraints of current proven critical by the model from
+        the last (satisfiable) check of current minus removed."""
+        if self.check_cache is not None and self.check_cache.hit is not None:
+            # answered from the cache, so there's no model
+            return set()
+        if self._rotator is None:
+            self._rotator = ModelRotator(self.clauses, self.nvars)
+        model = self.s.get_model(0, self.nvars)
+        return self._rotator.critical(model, current, removed)
+
     def to_c_lits(self, seed):
-        # this is slow...
         nv = self.nvars+1
+        if isinstance(seed, utils.Bitset):
+            return seed.to_array(offset=nv).tolist()
         return [nv + i for i in seed]
 
     def check_above(self, seed):
@@ -147,37 +546,78 @@ class MinisatSubsetSolver(object):
         x = self.s.new_var() + 1
         self.s.add_clause([-x] + self.to_c_lits(comp))  # add a temporary clause
         ret = self.s.solve([x] + self.to_c_lits(seed))  # activate the temporary clause and all seed clauses
-        self.s.add_clause([-x])  # remove the temporary clause
+        self.s.release_var(-x)  # remove the temporary clause (and recycle x)
         return ret
 
     def grow(self, seed):
-        current = seed
-
+        #current = seed
         #while self.check_above(current):
         #    current = self.s.sat_subset()
         #return current
 
-        # a bit slower at times, much faster others...
-        for x in self.complement(current):
-            # skip any included by sat_subset()
-            # assumes seed is always sorted
-            i = bisect.bisect_left(current, x)
-            if i != len(current) and current[i] == x:
+        if self.harvest is not None or self.check_cache is not None:
+            return self.insertion_grow(seed)
+        # adds each constraint in turn, plus any also-satisfied, all within pyminisolvers
+        return self.s.grow_subset(seed, offset=1)
+
+    # grow_subset() in Python, to see (and harvest or cache) each check
+    def insertion_grow(self, seed):
+        current = set(seed)
+        for i in self.complement(current):
+            if i in current:
                 continue
+            current.add(i)
 
-            current.append(x)
-            if self.check_subset(current):
-                # Add any also-satisfied constraint
-                current = self.s.sat_subset(offset=1)
+            if self.grow_check(current):
+                current = set(self.sat_subset())
             else:
-                current.pop()
+                current.remove(i)
 
         return current
 
 
+class ShrinkCostEstimate(object):
+    """A running estimate of one shrink backend's cost (in seconds) as a
+    linear function of seed size, fit by least squares with older samples
+    weighted down so the estimate follows changes over the enumeration.
+    """
+    def __init__(self, decay=0.95):
+        self.decay = decay
+        self.samples = 0
+        self._w = self._sx = self._sy = self._sxx = self._sxy = 0.0
+
+    def add(self, size, cost):
+        d = self.decay
+        self.samples += 1
+        self._w = d * self._w + 1
+        self._sx = d * self._sx + size
+        self._sy = d * self._sy + cost
+        self._sxx = d * self._sxx + size * size
+        self._sxy = d * self._sxy + size * cost
+
+    def predict(self, size):
+        if self._w == 0:
+            return 0.0
+        denom = self._w * self._sxx - self._sx * self._sx
+        if denom <= 1e-9 * self._w * self._sxx:
+            # all samples (nearly) the same size: assume cost is
+            # proportional to size
+            if self._sx == 0:
+                return self._sy / self._w
+            return self._sy * size / self._sx
+        slope = (self._w * self._sxy - self._sx * self._sy) / denom
+        intercept = (self._sy - slope * self._sx) / self._w
+        return max(0.0, intercept + slope * size)
+
+
 class MUSerSubsetSolver(MinisatSubsetSolver):
-    def __init__(self, filename, rand_seed=None, numthreads=1):
-        MinisatSubsetSolver.__init__(self, filename, rand_seed, store_dimacs=True)
+    adaptive = False  # choose MUSer2 or Minisat for each seed
+    min_samples = 3  # calls to each backend before trusting its estimate
+    explore_interval = 25  # shrinks between retries of the slower backend
+    explore_ratio = 2.0  # ...if its estimated cost is within this factor
+
+    def __init__(self, filename, rand_seed=None, numthreads=1, native_parse=True, cache=None):
+        MinisatSubsetSolver.__init__(self, filename, rand_seed, store_dimacs=True, native_parse=native_parse, cache=cache)
         self.core_pattern = re.compile(r'^v [\d ]+$', re.MULTILINE)
         self.numthreads = numthreads
         self.parallel = (numthreads > 1)
@@ -186,74 +626,177 @@ class MUSerSubsetSolver(MinisatSubsetSolver):
         self.muser_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), binary)
         utils.check_executable("MUSer2", self.muser_path)
 
+        self.pool_size = 1  # number of idle MUSer processes to keep ready
+        self._pool = []  # idle MUSer processes, waiting for input on stdin
         self._proc = None  # track the MUSer process
+        self._running = {}  # seeds (as frozensets) -> MUSer processes started by start_shrink()
+        self._pending = 0  # shrinks started by start_shrink() and not yet returned
+        self._finished = queue.Queue()
         atexit.register(self.cleanup)
 
-    # kill MUSer process if still running when we exit (e.g. due to a timeout)
+        self.serialize_groups()
+
+        self._costs = {'muser': ShrinkCostEstimate(), 'minisat': ShrinkCostEstimate()}
+        self._last_used = {'muser': 0, 'minisat': 0}
+        self._shrinks = 0
+
+    # kill MUSer processes if still running when we exit (e.g. due to a timeout)
     def cleanup(self):
         if self._proc:
             self._proc.kill()
+        for proc in list(self._running.values()):
+            proc.kill()
+        for proc in self._pool:
+            proc.kill()
+        self._pool = []
+
+    # start a MUSer process that will read its GCNF input from a pipe
+    def spawn_muser(self):
+        args = [self.muser_path, '-comp', '-grp', '-v', '-1']
+        if self.parallel:
+            args += ['-threads', str(self.numthreads), '-tmp']
+        args += ['/dev/stdin']
+        with self.stats.time('muser_spawn'):
+            return subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # get a MUSer process from the pool (or a new one if the pool is empty)
+    def get_muser(self):
+        if self._pool:
+            return self._pool.pop()
+        return self.spawn_muser()
+
+    # refill the pool, so the next processes start up while we do other work
+    def fill_pool(self):
+        while len(self._pool) < self.pool_size:
+            self._pool.append(self.spawn_muser())
+
+    # serialize each group's clauses once, so write_CNF() only has to add group-id prefixes
+    def serialize_groups(self):
+        lines = [self.clauses.dimacs_line(j) for j in range(self.clauses.nclauses)]
+        offs = self.clauses.group_offs
+        # each list starts with an empty string so that prefix.join(group)
+        # puts the prefix in front of every clause
+        self._group_lines = [[b""] + lines[offs[g]:offs[g+1]] for g in range(self.n + 1)]
+        self._hard_key = None  # the hard constraints in _hard_block
+        self._hard_block = None
 
     # write CNF output for MUSer2
     def write_CNF(self, cnffile, seed, hard):
         # Write CNF (grouped, with hard clauses, if any, in the 0 / Don't-care group)
         header = "p gcnf %d %d %d\n" % (self.nvars, len(seed), len(seed))
-        cnffile.write(header.encode())
+        chunks = [header.encode()]
 
-        # Note: not writing newlines because dimacs[j] already contains a newline
+        # Note: no newlines needed because dimacs_line() already contains a newline
 
-        # existing "Don't care" group
-        for j in self.groups[0]:
-            cnffile.write(b"{0} ")  # {0} = "Don't care" group
-            cnffile.write(self.dimacs[j])
-        # also include hard clauses in "Don't care" group
-        for i in hard:
-            for j in self.groups[i]:
-                cnffile.write(b"{0} ")
-                cnffile.write(self.dimacs[j])
+        # existing "Don't care" group plus the hard clauses, which only
+        # change when new hard constraints are found
+        hard_key = tuple(hard)
+        if hard_key != self._hard_key:
+            dontcare = b"{0} "  # {0} = "Don't care" group
+            self._hard_block = b"".join(dontcare.join(self._group_lines[i]) for i in (0,) + hard_key)
+            self._hard_key = hard_key
+        chunks.append(self._hard_block)
 
+        hard = set(hard)
         for g, i in enumerate(seed):
             if i in hard:
                 # skip hard clauses
                 continue
-            for j in self.groups[i]:
-                cnffile.write(("{%d} " % (g+1)).encode())
-                cnffile.write(self.dimacs[j])
+            chunks.append(("{%d} " % (g+1)).encode().join(self._group_lines[i]))
 
+        cnffile.writelines(chunks)
         cnffile.flush()
 
-    # override shrink method to use MUSer2
-    # NOTE: seed must be indexed (i.e., not a set)
-    def shrink(self, seed):
-        hard = [x for x in self._msolver.implies() if x > 0]
+    # get the hard constraints for shrinking a seed, or None if it's been explored
+    def shrink_hard(self, seed):
+        hard = self._msolver.implied()
         # In parallel mode, this seed may be explored by the time
         # we get here.  If it is, the hard constraints may include
         # constraints *outside* of the current seed, which would invalidate
         # the returned MUS.  If the seed is explored, give up on this seed.
         if not self._msolver.check_seed(seed):
             return None
+        return hard
+
+    # override shrink method to use MUSer2
+    # NOTE: seed must be indexed (i.e., not a set)
+    def shrink(self, seed):
+        hard = self.shrink_hard(seed)
+        if hard is None:
+            return None
 
         # Parallel MUSer doesn't like a formula with only hard constraints,
         # and it's a waste of time to call MUSer at all on it anyway.
         if len(seed) == len(hard):
             return seed
 
-        # Open tmpfile
-        with tempfile.NamedTemporaryFile('wb') as cnf:
-            self.write_CNF(cnf, seed, hard)
-            args = [self.muser_path, '-comp', '-grp', '-v', '-1']
-            if self.parallel:
-                args += ['-threads', str(self.numthreads), '-tmp']
-            args += [cnf.name]
+        if self.adaptive:
+            return self.adaptive_shrink(seed, hard, self.muser_shrink)
+        return self.muser_shrink(seed, hard)
 
-            # Run MUSer
-            self._proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            out, err = self._proc.communicate()
-            self._proc = None  # clear it when we're done (so cleanup won't try to kill it)
+    # pick the backend expected to shrink a seed of the given size fastest
+    def choose_backend(self, size):
+        for name in ('muser', 'minisat'):
+            if self._costs[name].samples == 0:
+                return name
+
+        if self._costs['minisat'].predict(size) < self._costs['muser'].predict(size):
+            best, other = 'minisat', 'muser'
+        else:
+            best, other = 'muser', 'minisat'
+
+        # Try the other backend a few times before trusting its estimate, and
+        # retry it every so often in case its cost has changed, as long as
+        # it isn't expected to be much slower.
+        explore = self._costs[other].samples < self.min_samples or \
+            self._shrinks - self._last_used[other] >= self.explore_interval
+        if explore and self._costs[other].predict(size) <= self.explore_ratio * self._costs[best].predict(size):
+            return other
+        return best
+
+    # shrink with Minisat or with muser_shrink(seed, hard), whichever is expected to be faster
+    def adaptive_shrink(self, seed, hard, muser_shrink):
+        self._shrinks += 1
+        backend = self.choose_backend(len(seed))
+        self._last_used[backend] = self._shrinks
+
+        if backend == 'muser':
+            # (MUSer's costs are recorded when its results are parsed)
+            with self.stats.time('shrink_muser'):
+                return muser_shrink(seed, hard)
+
+        start = utils._get_time()
+        with self.stats.time('shrink_minisat'):
+            ret = MinisatSubsetSolver.shrink(self, seed)
+        self._costs['minisat'].add(len(seed), utils._get_time() - start)
+        return ret
 
-            out = out.decode()
+    def muser_shrink(self, seed, hard):
+        start = utils._get_time()
+        cnf = self.muser_input(seed, hard)
 
-        # Parse result, return the core
+        # Run MUSer
+        self._proc = self.get_muser()
+        with self.stats.time('muser_run'):
+            out, err = self._proc.communicate(cnf)
+        self._proc = None  # clear it when we're done (so cleanup won't try to kill it)
+        self.fill_pool()
+
+        with self.stats.time('muser_parse'):
+            ret = self.parse_MUS(out, seed, hard)
+        self._costs['muser'].add(len(seed), utils._get_time() - start)
+        return ret
+
+    # build the GCNF for a seed in memory; it's passed to MUSer through a pipe
+    def muser_input(self, seed, hard):
+        with self.stats.time('muser_write'):
+            cnf = io.BytesIO()
+            self.write_CNF(cnf, seed, hard)
+            return cnf.getvalue()
+
+    # parse MUSer's output, returning the MUS
+    def parse_MUS(self, out, seed, hard):
+        out = out.decode()
         matchline = re.search(self.core_pattern, out).group(0)
         # pMUSer outputs 0 groups as part of MUSes, so we'll just filter it out to prevent the
         # duplicate clauses in MUSes
@@ -266,10 +809,99 @@ class MUSerSubsetSolver(MinisatSubsetSolver):
 
         return ret
 
+    # Asynchronous shrinking: start_shrink() starts shrinking a seed (with
+    # MUSer running in the background), and finished_shrinks() returns the
+    # MUSes once they're found, so several MUSer processes can run at once
+    # while the caller goes on with other work.
+
+    def start_shrink(self, seed):
+        """Start shrinking a seed.
+
+        Returns:
+            False if the seed has been explored (and will not be shrunk),
+            otherwise True.
+        """
+        hard = self.shrink_hard(seed)
+        if hard is None:
+            return False
+
+        if len(seed) == len(hard):
+            MUS = seed
+        elif self.adaptive:
+            MUS = self.adaptive_shrink(seed, hard, self.launch_muser)
+        else:
+            MUS = self.launch_muser(seed, hard)
+
+        self._pending += 1
+        if MUS is not None:
+            # done already
+            self._finished.put((seed, MUS, None))
+        return True
+
+    # start MUSer on a seed in the background; its output goes to self._finished
+    def launch_muser(self, seed, hard):
+        cnf = self.muser_input(seed, hard)
+        proc = self.get_muser()
+        self._running[frozenset(seed)] = proc
+
+        def run():
+            start = utils._get_time()
+            out, err = proc.communicate(cnf)
+            self._finished.put((seed, None, (proc, out, hard, utils._get_time() - start)))
+
+        job = threading.Thread(target=run)
+        job.daemon = True
+        job.start()
+        self.fill_pool()
+        return None  # no MUS yet
+
+    def cancel_shrink(self, seed):
+        """Stop shrinking a seed given to start_shrink().  Its result from
+        finished_shrinks() will be None."""
+        proc = self._running.get(frozenset(seed))
+        if proc is not None:
+            proc.kill()
+
+    def pending_shrinks(self):
+        """Return the number of shrinks started but not yet returned by
+        finished_shrinks()."""
+        return self._pending
+
+    def finished_shrinks(self, block=False):
+        """Get the results of any shrinks started with start_shrink() that
+        have finished.
+
+        Args:
+            block: If True, wait until at least one has finished (if any are
+                   pending).
+
+        Returns:
+            A list of (seed, MUS) pairs.
+        """
+        results = []
+        while self._pending > 0:
+            try:
+                seed, MUS, muser_out = self._finished.get(block and not results)
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if muser_out is not None:
+                proc, out, hard, elapsed = muser_out
+                del self._running[frozenset(seed)]
+                if proc.returncode < 0:
+                    # killed by cancel_shrink()
+                    MUS = None
+                else:
+                    with self.stats.time('muser_parse'):
+                        MUS = self.parse_MUS(out, seed, hard)
+                    self._costs['muser'].add(len(seed), elapsed)
+            results.append((seed, MUS))
+        return results
+
 
 class ImprovedImpliesSubsetSolver(MinisatSubsetSolver):
-    def __init__(self, infile, rand_seed=None, store_dimacs=False):
-        MinisatSubsetSolver.__init__(self, infile, rand_seed, store_dimacs)
+    def __init__(self, infile, rand_seed=None, store_dimacs=False, native_parse=True, cache=None):
+        MinisatSubsetSolver.__init__(self, infile, rand_seed, store_dimacs, native_parse, cache)
         self._known_MSS = 0
         self._known_MUS = 0
 
@@ -283,22 +915,29 @@ class ImprovedImpliesSubsetSolver(MinisatSubsetSolver):
         current = set(seed)
 
         if self._known_MSS > 0:
-            implications = self._msolver.implies(-x for x in self.complement(current))
+            implications = self._msolver.implies(self.complement(current).to_array(negate=True))
             hard = set(x for x in implications if x > 0)
         else:
             hard = set()
 
+        critical = self.rotate if self.model_rotation else None
+        if self.shrink_algo == 'dichotomic':
+            return utils.dichotomic_shrink(seed, hard, self.shrink_check, self.unsat_core, critical)
+
+        rotated = set()
         for i in seed:
-            if i not in current or i in hard:
+            if i not in current or i in hard or i in rotated:
                 continue
             current.remove(i)
 
-            if self.check_subset(current):
+            if self.shrink_check(current):
                 current.add(i)
+                if critical is not None:
+                    rotated.update(critical(current, [i]))
             else:
-                current = set(self.s.unsat_core(offset=1))
+                current = set(self.unsat_core())
                 if self._known_MSS > 0:
-                    implications = self._msolver.implies(-x for x in self.complement(current))
+                    implications = self._msolver.implies(self.complement(current).to_array(negate=True))
                     hard = set(x for x in implications if x > 0)
 
         return current
@@ -317,10 +956,10 @@ class ImprovedImpliesSubsetSolver(MinisatSubsetSolver):
                 continue
             current.add(i)
 
-            if not self.check_subset(current):
+            if not self.grow_check(current):
                 current.remove(i)
             else:
-                current = set(self.s.sat_subset(offset=1))
+                current = set(self.sat_subset())
                 if self._known_MUS > 0:
                     implications = self._msolver.implies(current)
                     dont_add = set(x for x in implications if x < 0)
@@ -6,20 +6,19 @@ try:
 except ImportError:
     import Queue as queue
 
+import utils
 from pyminisolvers import minisolvers
 
 
 class MCSEnumerator(object):
     def __init__(self, csolver, stats, config, pipe=None):
         self.solver = csolver.s
-        self.clauses = []
+        self.clauses = csolver.clauses  # shared ClauseStore
         self.blk_downs = []
         self.blk_ups = []
-        self.setup_clauses(csolver.dimacs)
         self.nvars = csolver.nvars
         self.nclauses = csolver.nclauses
         self.n = csolver.n
-        self.groups = csolver.groups
         self.instrumented_solver = None
         self.stats = stats
         self.config = config
@@ -39,10 +38,14 @@ class MCSEnumerator(object):
                     # exit process on terminate message
                     os._exit(0)
 
-                if self.config['comms_ignore']:
-                    continue
+                self.receive(res)
 
-                self.incoming_queue.put(res)
+    def receive(self, res):
+        # queue a result from another enumerator to be blocked
+        if self.config['comms_ignore']:
+            return
+
+        self.incoming_queue.put(res)
 
     def add_received(self, add_to_instrumented=False):
         while not self.incoming_queue.empty():
@@ -65,35 +68,21 @@ class MCSEnumerator(object):
 
         return solver.solve(assumps)
 
-    def setup_clauses(self, dimacs):
-        for clause in dimacs:
-            self.clauses.append(array.array('i', [int(i) for i in clause.split()[:-1]]))
-
     def complement(self, aset):
-        return set(range(1, self.n+1)).difference(aset)
+        return utils.Bitset.from_seed(self.n, aset).complement()
 
     def setup_solver(self):
         solver = minisolvers.MinicardSubsetSolver()
         solver.set_varcounts(self.nvars, self.n)
 
         assert (self.n <= self.nclauses)
-        gcnf_in = (self.n != self.nclauses)  # In gcnf, # of groups is less than # of clauses
 
         # Create new vars
         while solver.nvars() < self.nvars + self.n:
                 solver.new_var()
 
-        # add clauses ...
-        if gcnf_in:
-            for groupid, clauses in self.groups.iteritems():
-                for j in clauses:
-                    if groupid == 0:
-                        solver.add_clause(self.clauses[j])
-                    else:
-                        solver.add_clause_instrumented(self.clauses[j], groupid-1)
-        else:
-            for i, clause in enumerate(self.clauses):
-                solver.add_clause_instrumented(clause, i)
+        # add clauses (hard and instrumented) straight from the shared clause store
+        solver.add_clause_store(self.clauses.lits, self.clauses.clause_offs, self.clauses.group_offs)
         for clause in self.blk_downs:
             self.block_down(solver, clause)
         for clause in self.blk_ups:
@@ -122,7 +111,7 @@ class MCSEnumerator(object):
             self.instrumented_solver = self.setup_solver()
             self.instrumented_solver.add_atmost([-(i+self.nvars) for i in included], k)  # adding a bound for selector variables
 
-            instrumented = [(i+self.nvars) for i in self.complement(included)]
+            instrumented = self.complement(included).to_array(offset=self.nvars)
             while self.check_sat(self.instrumented_solver, instrumented):
                 MSS = self.get_MSS()
                 res = ("S", MSS)
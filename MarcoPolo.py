@@ -1,6 +1,8 @@
 import os
 import threading
 
+import utils
+
 try:
     import queue
 except ImportError:
@@ -18,6 +20,17 @@ class MarcoPolo(object):
         self.n = self.map.n   # number of constraints
         self.got_top = False  # track whether we've explored the complete set (top of the lattice)
 
+        # shrink several seeds at once, if the subset solver supports it
+        self.async_shrink = self.config['shrink_jobs'] > 1 and hasattr(self.subs, 'start_shrink')
+
+        # queue the sets the subset solver comes across while growing or shrinking, if it supports it
+        if self.config['harvest'] > 0 and hasattr(self.subs, 'harvest'):
+            self.subs.harvest = self.seeds.harvest
+        self._shrinking = {}  # seeds being shrunk -> whether their results are no longer needed
+        self._cube_messages = queue.Queue()  # the master's messages about cubes (with config['cubes'])
+        self._cube_id = None  # the master's id for the current cube
+        self._split_scores = [0] * (self.n + 1)  # per constraint: # of MUSes and MCSes found containing it
+
         self.pipe = pipe
         # if a pipe is provided, use it to receive results from other enumerators
         if self.pipe:
@@ -31,20 +44,95 @@ class MarcoPolo(object):
                 if res == 'terminate':
                     # exit process on terminate message
                     os._exit(0)
-                # Otherwise, we've received another result,
-                # update blocking clauses.
-                # Requires map solver to be thread-safe:
-                assert hasattr(self.map, "__synchronized__") and self.map.__synchronized__
-
-                if self.config['comms_ignore']:
+                if res[0] in ('cube', 'split'):
+                    # handled between seeds (see seeds_in_cubes())
+                    self._cube_messages.put(res)
                     continue
-
-                if res[0] == 'S':
-                    self.map.block_down(res[1])
-                elif res[0] == 'U':
-                    self.map.block_up(res[1])
-                else:
-                    assert False
+                # Otherwise, we've received another result.
+                self.receive(res)
+
+    def receive(self, res):
+        # Queue a result from another enumerator to be blocked the next time
+        # the map solver is used (so the receiving thread never waits on it).
+        if self.config['comms_ignore']:
+            return
+
+        assert res[0] in ('S', 'U')
+        self.map.receive(res)
+
+    # Cube-and-conquer (with config['cubes']): the master hands each
+    # enumerator a cube (see MapSolver.set_cube()) to find seeds in, and
+    # another once that's exhausted, and it may ask an enumerator to split
+    # its cube in two to give half of it to another.  Messages about a cube
+    # carry the master's id for it.
+
+    def seeds_in_cubes(self):
+        '''The seeds to explore: all of them, or with config['cubes'], those
+        in each cube in turn.  (None, None) means there are no more in the
+        cube until the shrinks still running finish.'''
+        if self.config['cubes']:
+            self.handle_cube_messages(idle=True)
+        while True:
+            for seed, known_max in self.seeds:
+                yield seed, known_max
+                if self.config['cubes']:
+                    self.handle_cube_messages()
+
+            if not self.config['cubes']:
+                return
+            if self.async_shrink and self.subs.pending_shrinks() > 0:
+                # (the cube isn't done until the seeds being shrunk are blocked)
+                yield None, None
+                continue
+            self.pipe.send(('cube_done', self._cube_id))
+            self.handle_cube_messages(idle=True)
+
+    def handle_cube_messages(self, idle=False):
+        # handle any messages from the master about cubes, waiting for a new cube if idle
+        while idle or not self._cube_messages.empty():
+            msg = self._cube_messages.get()
+            if msg[0] == 'cube':
+                self._cube_id = msg[1]
+                self.seeds.set_cube(msg[2])
+                idle = False
+            else:  # 'split'
+                # (the cube may be done already)
+                can_split = not idle and msg[1] == self._cube_id
+                self.pipe.send(('cube', msg[1], self.split_cube() if can_split else None))
+
+    def split_cube(self):
+        '''Split the current cube on a constraint not fixed within it,
+        keeping the half in the bias's direction.  The constraint is the
+        one in the most MUSes and MCSes found so far, as the seeds on either
+        side of such a constraint are the least likely to grow or shrink to
+        the same results (unlike one in no MUS, say, which every MSS
+        contains).
+
+        Returns:
+            The other half, or None if the cube is exhausted or no
+            constraint is free to split on.
+        '''
+        cube = self.map.cube
+        implied = set(self.map.implies(cube))
+        if not implied.issuperset(cube):
+            # implies() only leaves out an assumption on a conflict, in
+            # which case the cube has no unexplored seeds left
+            return None
+        fixed = set(abs(lit) for lit in implied)
+        fixed.update(abs(lit) for lit in cube)
+        free = [x for x in range(1, self.n + 1) if x not in fixed]
+        if not free:
+            return None
+        var = max(free, key=self._split_scores.__getitem__)
+        lit = var if self.bias_high else -var
+        self.seeds.set_cube(cube + [lit])
+        self.stats.increment_counter('cube_split')
+        return cube + [-lit]
+
+    def score_split(self, result):
+        # count a MUS or MCS for choosing constraints to split cubes on
+        for i in result:
+            self._split_scores[i] += 1
 
     def record_delta(self, name, oldlen, newlen, up):
         if up:
@@ -54,10 +142,88 @@ class MarcoPolo(object):
             assert newlen <= oldlen
             self.stats.add_stat("delta.%s.down" % name, float(oldlen - newlen) / self.n)
 
+    def report_MUS(self, MUS):
+        if self._shrinking:
+            self.cancel_shrinks(MUS)
+
+        with self.stats.time('block'):
+            res = ("U", MUS)
+            yield res
+
+            try:
+                self.subs.increment_MUS()
+            except AttributeError:
+                pass
+
+            self.map.block_up(MUS)
+
+        if self.config['cubes']:
+            self.score_split(MUS)
+
+        if self.config['verbose']:
+            print("- MUS blocked.")
+
+    def start_shrink(self, seed):
+        with self.stats.time('shrink'):
+            if not self.subs.start_shrink(seed):
+                # seed was explored in another process
+                # in the meantime
+                self.stats.increment_counter("parallel_rejected")
+                return
+
+            # The seed's MUS is a subset of it, so block up from the seed
+            # right away to keep the Map solver from returning it (or any
+            # superset) again while it is being shrunk.
+            self._shrinking[frozenset(seed)] = False
+            self.map.block_up(seed)
+
+        if self.config['verbose']:
+            print("- Shrinking in the background.")
+
+    def cancel_shrinks(self, MUS):
+        # Any seed being shrunk that contains this MUS is covered by blocking
+        # up from the MUS, so its shrink is no longer needed.  (If it has a
+        # different MUS, that is still unexplored and will be found later.)
+        MUSkey = frozenset(MUS)
+        for key, done in self._shrinking.items():
+            if not done and MUSkey <= key:
+                self._shrinking[key] = True
+                self.subs.cancel_shrink(key)
+
+    def collect_shrinks(self, block):
+        if block:
+            with self.stats.time('shrink_wait'):
+                results = self.subs.finished_shrinks(block=True)
+        else:
+            results = self.subs.finished_shrinks()
+
+        for seed, MUS in results:
+            key = frozenset(seed)
+            done = self._shrinking.pop(key)
+            if done:
+                self.stats.increment_counter("shrink_cancelled")
+                continue
+            MUSkey = frozenset(MUS)
+            if MUSkey != key and MUSkey not in self._shrinking and not self.map.check_seed(MUS):
+                # found already (e.g., by another process)
+                self.stats.increment_counter("shrink_discarded")
+                continue
+
+            self.record_delta('shrink', len(seed), len(MUS), False)
+            if self.config['verbose']:
+                print("- Shrink() -> MUS")
+            for res in self.report_MUS(MUS):
+                yield res
+
     def enumerate(self):
         '''MUS/MCS enumeration with all the bells and whistles...'''
 
-        for seed, known_max in self.seeds:
+        for seed, known_max in self.seeds_in_cubes():
+            if self.async_shrink:
+                for res in self.collect_shrinks(block=seed is None):
+                    yield res
+            if seed is None:
+                continue
 
             if self.config['verbose']:
                 print("- Initial seed: %s" % " ".join([str(x) for x in seed]))
@@ -89,6 +255,9 @@ class MarcoPolo(object):
                         print("- Grow() -> MSS")
 
                 with self.stats.time('block'):
+                    # the same Bitset is reported, sent to any other
+                    # processes, and complemented to block down
+                    MSS = utils.Bitset.from_seed(self.n, MSS)
                     res = ("S", MSS)
                     yield res
 
@@ -99,6 +268,9 @@ class MarcoPolo(object):
 
                     self.map.block_down(MSS)
 
+                if self.config['cubes']:
+                    self.score_split(MSS.complement())
+
                 if self.config['verbose']:
                     print("- MSS blocked.")
 
@@ -106,6 +278,12 @@ class MarcoPolo(object):
                 self.got_top = True  # any unsat set covers the top of the lattice
                 if known_max:
                     MUS = seed
+                elif self.async_shrink:
+                    self.start_shrink(seed)
+                    while self.subs.pending_shrinks() >= self.config['shrink_jobs']:
+                        for res in self.collect_shrinks(block=True):
+                            yield res
+                    continue
                 else:
                     with self.stats.time('shrink'):
                         oldlen = len(seed)
@@ -123,19 +301,13 @@ class MarcoPolo(object):
                     if self.config['verbose']:
                         print("- Shrink() -> MUS")
 
-                with self.stats.time('block'):
-                    res = ("U", MUS)
+                for res in self.report_MUS(MUS):
                     yield res
 
-                    try:
-                        self.subs.increment_MUS()
-                    except AttributeError:
-                        pass
-
-                    self.map.block_up(MUS)
-
-                if self.config['verbose']:
-                    print("- MUS blocked.")
+        # finish any shrinks still running
+        while self.async_shrink and self.subs.pending_shrinks() > 0:
+            for res in self.collect_shrinks(block=True):
+                yield res
 
         if self.pipe:
             self.pipe.send(('complete', self.stats))
@@ -143,31 +315,143 @@ class MarcoPolo(object):
 
 
 class SeedManager(object):
+    """Supplies seeds: any queued with add_seed() or harvest(), lowest
+    priority first and skipping any explored since they were queued, then
+    models of the map solver.
+
+    With config['harvest'] > 0, up to that many sets found satisfiable or
+    unsatisfiable while growing or shrinking other seeds are queued by
+    harvest(), so the caller grows or shrinks them (and blocks the results)
+    before asking the map solver for another seed.  Queued seeds outside
+    the map solver's cube (see set_cube()) are dropped.
+
+    With config['prefetch'], the map solver (which must be synchronized) is
+    asked for the next seed in a background thread while the caller checks
+    and grows or shrinks the current one.  A prefetched seed may have been
+    explored by the time it's used, so it is checked first and replaced by a
+    fresh one if it has.
+    """
     def __init__(self, msolver, stats, config):
         self.map = msolver
         self.stats = stats
         self.config = config
-        self._seed_queue = queue.Queue()
+        self._seed_queue = queue.PriorityQueue()  # (priority, count, seed, known_max)
+        self._queued = 0   # count of seeds queued so far (to keep FIFO order among equal priorities)
+        self._harvested = set()  # harvested seeds currently queued (as frozensets)
+
+        if config['prefetch']:
+            assert hasattr(self.map, "__synchronized__") and self.map.__synchronized__
+            self._prefetch_requests = queue.Queue()  # seeds to find the next seed after
+            self._prefetched = queue.Queue()
+            self._prefetching = False
+            prefetch_thread = threading.Thread(target=self.prefetch_thread)
+            prefetch_thread.daemon = True
+            prefetch_thread.start()
 
     def __iter__(self):
         return self
 
     def __next__(self):
         with self.stats.time('seed'):
-            if not self._seed_queue.empty():
-                return self._seed_queue.get()
+            while not self._seed_queue.empty():
+                _, _, seed, known_max = self._seed_queue.get()
+                self._harvested.discard(frozenset(seed))
+                if not self.in_cube(seed):
+                    # (check_seed() ignores the cube)
+                    self.stats.increment_counter('queued_seed_outside_cube')
+                    continue
+                if self.map.check_seed(seed):
+                    self.stats.increment_counter('queued_seed')
+                    return seed, known_max
+                self.stats.increment_counter('queued_seed_explored')
+
+            if self.config['prefetch']:
+                seed, known_max = self.prefetched_seed()
             else:
                 seed, known_max = self.seed_from_solver()
-                if seed is None:
-                    raise StopIteration
-                return seed, known_max
+            if seed is None:
+                raise StopIteration
+            return seed, known_max
+
+    def add_seed(self, seed, known_max, priority=0):
+        self._queued += 1
+        self._seed_queue.put((priority, self._queued, seed, known_max))
+
+    def harvest(self, seed, is_sat):
+        """Queue a set found satisfiable or unsatisfiable along the way
+        (e.g., while shrinking or growing another seed), if there's room
+        and it isn't queued already.  Sets expected to need the least
+        growing or shrinking (the largest satisfiable ones and the smallest
+        unsatisfiable ones) come first.
+        """
+        key = frozenset(seed)
+        if key in self._harvested:
+            return
+        if len(self._harvested) >= self.config['harvest']:
+            self.stats.increment_counter('harvest_dropped')
+            return
+        self.stats.increment_counter('harvest_sat' if is_sat else 'harvest_unsat')
+        self._harvested.add(key)
+        priority = self.map.n - len(key) if is_sat else len(key)
+        self.add_seed(sorted(key), False, priority)
+
+    def set_cube(self, cube):
+        # restrict the map solver's seeds to a cube (see MapSolver.set_cube())
+        if self.config['prefetch'] and self._prefetching:
+            # (a seed prefetched from the old cube may not be in the new one,
+            # nor maximal as expected for it)
+            self._prefetched.get()
+            self._prefetching = False
+        self.map.set_cube(cube)
+
+        # drop any queued seeds outside the new cube (which are another
+        # enumerator's to explore)
+        queued = []
+        while not self._seed_queue.empty():
+            queued.append(self._seed_queue.get())
+        for item in queued:
+            if self.in_cube(item[2]):
+                self._seed_queue.put(item)
+            else:
+                self._harvested.discard(frozenset(item[2]))
+                self.stats.increment_counter('queued_seed_outside_cube')
 
-    def add_seed(self, seed, known_max):
-        self._seed_queue.put((seed, known_max))
+    def in_cube(self, seed):
+        # whether a seed is within the map solver's cube
+        members = set(seed)
+        return all((abs(lit) in members) == (lit > 0) for lit in self.map.cube)
 
     def seed_from_solver(self):
-        known_max = self.config['maximize']
+        # (with a bias, the map solver's models are maximal/minimal; see MapSolver)
+        known_max = self.config['maximize'] and self.map.cube_closed
         return self.map.next_seed(), known_max
 
+    def prefetched_seed(self):
+        seed = None
+        if self._prefetching:
+            seed = self._prefetched.get()
+            self._prefetching = False
+            # (no seed from the prefetch may only mean that the last seed
+            # hasn't been blocked yet, so that's checked with the solver, too)
+            if seed is not None:
+                hit = self.map.check_seed(seed)
+                self.stats.increment_counter('prefetch_hit' if hit else 'prefetch_waste')
+                self.stats.add_stat('prefetch_hit_ratio', float(hit))
+                if not hit:
+                    seed = None
+
+        if seed is None:
+            seed = self.map.next_seed()
+
+        if seed is not None:
+            self._prefetch_requests.put(seed)
+            self._prefetching = True
+        return seed, self.config['maximize'] and self.map.cube_closed
+
+    def prefetch_thread(self):
+        while True:
+            seed = self._prefetch_requests.get()
+            self._prefetched.put(self.map.next_seed_excluding(seed))
+
     # for python 2 compatibility
     next = __next__
@@ -1,4 +1,5 @@
 from z3 import *
+import utils
 
 
 def dimacs_var(i):
@@ -38,10 +39,16 @@ class Z3SubsetSolver(object):
     s = None
     varcache = {}
     idcache = {}
+    shrink_algo = 'deletion'  # or 'dichotomic'
+    check_cache = None  # CNFsolvers.CheckCache, if any
 
     def __init__(self, filename):
         self.read_constraints(filename)
         self.make_solver()
+        self.stats = utils.Statistics()  # replaced by the enumerator's via set_stats()
+
+    def set_stats(self, stats):
+        self.stats = stats
 
     def read_constraints(self, filename):
         if filename.endswith('.cnf'):
@@ -71,8 +78,10 @@ class Z3SubsetSolver(object):
         return self.varcache[i]
 
     def check_subset(self, seed, improve_seed=False):
-        assumptions = self.to_c_lits(seed)
-        is_sat = (self.s.check(assumptions) == sat)
+        if self.check_cache is not None:
+            is_sat = self.check_cache.check(seed, self.solve_subset, self.stats)
+        else:
+            is_sat = self.solve_subset(seed)
         if improve_seed:
             if is_sat:
                 # TODO: difficult to do efficiently...
@@ -84,17 +93,29 @@ class Z3SubsetSolver(object):
         else:
             return is_sat
 
+    def solve_subset(self, seed):
+        assumptions = self.to_c_lits(seed)
+        return self.s.check(assumptions) == sat
+
     def to_c_lits(self, seed):
         return [self.c_var(i) for i in seed]
 
     def complement(self, aset):
-        return set(range(1, self.n+1)).difference(aset)
+        return utils.Bitset.from_seed(self.n, aset).complement()
 
     def seed_from_core(self):
+        if self.check_cache is not None:
+            return self.check_cache.improved(self.core_from_solver, False)
+        return self.core_from_solver()
+
+    def core_from_solver(self):
         core = self.s.unsat_core()
         return [self.idcache[self.get_id(x)] for x in core]
 
     def shrink(self, seed, hard=[]):
+        if self.shrink_algo == 'dichotomic':
+            return utils.dichotomic_shrink(seed, hard, self.check_subset, self.seed_from_core)
+
         current = set(seed)
         for i in seed:
             if i not in current or i in hard:
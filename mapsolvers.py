@@ -1,12 +1,80 @@
 import abc
 import array
+import collections
+import threading
+import utils
 from pyminisolvers import minisolvers
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def remove_subsumed(clauses):
+    """Remove clauses subsumed by others (i.e., supersets of other
+    clauses, including duplicates).
+
+    >>> remove_subsumed([[1, 2, 3], [-1, 2], [2, 3], [3, 2]])
+    [[-1, 2], [2, 3]]
+
+    Returns:
+        A list of the remaining clauses, in their original order.
+    """
+    litsets = [frozenset(clause) for clause in clauses]
+    # each kept clause is indexed under one of its literals, as only clauses
+    # containing that literal can be subsumed by it
+    index = collections.defaultdict(list)
+    keep = []
+    for i in sorted(range(len(clauses)), key=lambda i: len(litsets[i])):
+        lits = litsets[i]
+        if not lits:
+            return [clauses[i]]  # the empty clause subsumes all others
+        if any(litsets[j] <= lits for lit in lits for j in index[lit]):
+            continue
+        index[min(lits)].append(i)
+        keep.append(i)
+    return [clauses[i] for i in sorted(keep)]
+
 
 class MapSolver(object):
-    """The abstract base class for any MapSolver, implementing common utility functions."""
+    """The abstract base class for any MapSolver, implementing common utility functions.
+
+    With a bias of True or False, the solver's variables for the constraints
+    are given that preferred polarity, which it follows in every decision on
+    them (regardless of phase saving).  Any other variables are fixed or
+    assumed, so every model it finds is maximal (or minimal, for False) in a
+    single solve: a variable is only given the other value when that is
+    forced by propagation, and so by the values of variables assigned
+    before it.  Hence next_seed() returns maximal (minimal) unexplored seeds
+    without needing maximize_seed().
+
+    If rebuild_interval is set (before any clauses are added), the blocking
+    clauses are kept, and after every rebuild_interval of them, the solver is
+    replaced with a new one containing only the blocking clauses not
+    subsumed by others and any top-level implied literals.  That drops
+    learned clauses, any temporary clauses and their variables that could
+    not be recycled, and subsumed blocking clauses, so the solver's memory and
+    per-solve cost don't keep growing with them over a long enumeration.
+
+    With set_cube(), next_seed() only returns seeds within a given cube
+    (e.g., one part of the lattice partitioned among several enumerators).
+
+    Alternatively, if compact_threshold is set, the search for subsumed
+    blocking clauses runs in a background thread once there are
+    compact_threshold of them (and again whenever their number doubles).
+    When it finishes, the solver is rebuilt without any it found, or just
+    simplified if there were none.
+    """
     __metaclass__ = abc.ABCMeta
 
+    rebuild_interval = 0   # (0 = never rebuild)
+    compact_threshold = 0  # (0 = never compact)
+
+    _assumptions = []  # extra assumptions for next_seed()'s solves (see next_seed_excluding())
+    cube = []           # literals every seed from next_seed() must satisfy (see set_cube())
+    cube_closed = True
+
     @abc.abstractmethod  # must be overridden, but can be called via super()
     def __init__(self, n, bias=True, dump=None):
         """Common initialization.
@@ -19,19 +87,98 @@ class MapSolver(object):
         """
         self.n = n
         self.bias = bias
-        self.all_n = set(range(1, n+1))  # used in complement fairly frequently
         self.dump = dump
+        self._blocking = []     # blocking clauses (if rebuilding or compacting)
+        self._since_rebuild = 0
+        self._next_compact = 0
+        self._compaction = None  # a running compaction: (thread, # of clauses it covers, its result)
+        self._seed_time = 0.0    # 'seed' time and # of blocking clauses at the last compaction
+        self._seed_clauses = 0
+        self._reset_implied()
+        self._received = queue.Queue()  # results from other enumerators, not yet blocked
+        self.stats = utils.Statistics()
+
+    def set_stats(self, stats):
+        self.stats = stats
+
+    @abc.abstractmethod
+    def _new_solver(self):
+        """Create and initialize a solver with no blocking clauses."""
+        pass
 
     @abc.abstractmethod
     def next_seed(self):
         pass
 
+    def receive(self, result):
+        """Queue a result received from another enumerator, ('S', MSS) or
+        ('U', MUS), to be blocked the next time the solver is used (see
+        add_received()).  Unlike the other methods, this can be called from
+        any thread while another is using the solver.
+        """
+        self._received.put(result)
+
+    def add_received(self):
+        """Block any results queued by receive() since the last call.
+
+        This may run in a thread other than the caller's (e.g., a seed
+        prefetch thread), so it leaves any rebuild or compaction the new
+        clauses call for to the caller's next block_down() or block_up(),
+        as finishing a compaction opens timers in the stats and reads the
+        caller's 'seed' time.
+        """
+        while not self._received.empty():
+            kind, seed = self._received.get()
+            if kind == 'S':
+                self.block_down(seed, maintain=False)
+            else:
+                self.block_up(seed, maintain=False)
+            self.stats.increment_counter('map_received')
+
+    def set_cube(self, cube):
+        """Restrict next_seed() to the seeds in a cube: a list of literals
+        over the constraints' variables (positive for constraints in the
+        seed, negative for those out of it).  An empty cube lifts the
+        restriction.
+
+        With a bias, the seeds are then maximal (minimal) within the cube,
+        and so in the whole map only if every literal in the cube has the
+        bias's polarity (making the cube closed upward (downward)), as
+        recorded in cube_closed.
+        """
+        self.cube = list(cube)
+        self.cube_closed = all((lit > 0) == bool(self.bias) for lit in self.cube)
+
+    def next_seed_excluding(self, seed):
+        """Find the next seed as next_seed() does, but as if the given seed
+        were already explored (e.g., to find the seed after it while it is
+        still being checked and grown or shrunk).
+
+        Returns:
+            A seed as with next_seed(), or None if there is none other than
+            the given seed.
+        """
+        point = utils.Bitset.from_seed(self.n, seed)
+        tmpvar = self._solver.new_var() + 1
+        # temporary clause: some constraint is in or out in contrast to seed
+        lits = array.array('i', [-tmpvar])
+        lits.extend(point.complement().to_array())
+        lits.extend(point.to_array(negate=True))
+        self._solver.add_clause(lits)
+        self._assumptions = [tmpvar]
+        try:
+            return self.next_seed()
+        finally:
+            self._assumptions = []
+            self._solver.release_var(-tmpvar)  # remove the temporary clause (and recycle tmpvar, if possible)
+
     def check_seed(self, seed):
         """Check whether a given seed is still unexplored.
 
         Returns:
             True if seed is unexplored (i.e., its corresponding assignment is a model)
         """
+        self.add_received()
         return self._solver.check_complete(positive_lits=seed)
 
     def implies(self, assumptions=None):
@@ -42,8 +189,49 @@ class MapSolver(object):
         Returns:
             An array of literals.
         """
+        self.add_received()
         return self._solver.implies(assumptions)
 
+    def implied(self):
+        """Get the constraints implied by the current formula (i.e., those
+        in every unexplored seed).
+
+        These are tracked incrementally: each call reads only the literals
+        the solver has assigned at the top level since the last call.
+
+        Returns:
+            An array of constraint indexes.  (It is never modified after
+            it's returned, so callers may keep it.)
+        """
+        self.add_received()
+        start = self._trail_len
+        # (re-read the last literal seen, to check the trail only grew)
+        lits = self._solver.top_level_trail(max(0, start - 1))
+        if lits is None:
+            # no unexplored seeds remain
+            self._reset_implied()
+            return self._implied
+        if start > 0:
+            if len(lits) > 0 and lits[0] == self._trail_last:
+                lits = lits[1:]
+            else:
+                # released variables were dropped from the trail: start over
+                self._reset_implied()
+                lits = self._solver.top_level_trail()
+
+        if len(lits) > 0:
+            self._trail_len += len(lits)
+            self._trail_last = lits[-1]
+            new = array.array('i', [x for x in lits if 0 < x <= self.n])
+            if new:
+                self._implied = self._implied + new
+        return self._implied
+
+    def _reset_implied(self):
+        self._implied = array.array('i')
+        self._trail_len = 0     # number of top-level trail literals read by implied()
+        self._trail_last = 0    # the last of them
+
     def find_above(self, seed):
         """Look for and return any unexplored point including the given seed.
             Calling map.find_above(MSS) after map.block_down(MSS) will thus find
@@ -90,7 +278,7 @@ class MapSolver(object):
             if direction:
                 # search for a solution w/ all of the current seed plus at
                 # least one from the current complement.
-                self._solver.add_clause([-tmpvar] + list(comp))  # temporary clause
+                self._solver.add_clause([-tmpvar] + comp.to_array().tolist())  # temporary clause
                 # activate the temporary clause and all seed clauses
                 havenew = self._solver.solve([tmpvar] + list(seed))
             else:
@@ -98,8 +286,8 @@ class MapSolver(object):
                 # least one from the current seed removed.
                 self._solver.add_clause([-tmpvar] + [-i for i in seed])  # temporary clause
                 # activate the temporary clause and deactivate complement clauses
-                havenew = self._solver.solve([tmpvar] + [-i for i in comp])
-            self._solver.add_clause([-tmpvar])  # remove the temporary clause
+                havenew = self._solver.solve([tmpvar] + comp.to_array(negate=True).tolist())
+            self._solver.release_var(-tmpvar)  # remove the temporary clause (and recycle tmpvar, if possible)
 
             if havenew:
                 seed = self.get_seed()
@@ -107,48 +295,135 @@ class MapSolver(object):
                 return seed
 
     def complement(self, aset):
-        """Return the complement of a given set w.r.t. the set of mapped constraints."""
-        return self.all_n.difference(aset)
+        """Return the complement of a given set w.r.t. the set of mapped constraints.
 
-    def add_clause(self, clause):
-        """Add a given clause to the Map solver."""
+        Returns:
+            A utils.Bitset.
+        """
+        return utils.Bitset.from_seed(self.n, aset).complement()
+
+    def add_clause(self, clause, maintain=True):
+        """Add a given clause to the Map solver, then rebuild or compact the
+        solver if that's due (unless maintain is False)."""
         self._solver.add_clause(clause)
         if self.dump is not None:
             self.dump.write(" ".join(str(lit) for lit in clause) + " 0\n")
-
-    def block_down(self, frompoint):
+        if self.rebuild_interval or self.compact_threshold:
+            self._blocking.append(array.array('i', clause))
+        if self.rebuild_interval:
+            self._since_rebuild += 1
+        if not maintain:
+            return
+        if self.rebuild_interval and self._since_rebuild >= self.rebuild_interval:
+            self.rebuild()
+        if self.compact_threshold:
+            if self._compaction is not None:
+                self.finish_compaction()
+            elif len(self._blocking) >= max(self.compact_threshold, self._next_compact):
+                self.start_compaction()
+
+    def rebuild(self):
+        """Replace the solver with a new one containing only the blocking
+        clauses not subsumed by others and the literals currently implied at
+        the top level (which may have come from learned clauses)."""
+        self._compaction = None  # (superseded)
+        self._blocking = remove_subsumed(self._blocking)
+        self.replace_solver()
+        self._since_rebuild = 0
+
+    def replace_solver(self):
+        """Replace the solver with a new one containing the blocking
+        clauses in self._blocking and the literals currently implied at the
+        top level."""
+        units = [x for x in self._solver.implies() if abs(x) <= self.n]
+        self._solver = self._new_solver()
+        self._reset_implied()
+        for lit in units:
+            self._solver.add_clause([lit])
+        for clause in self._blocking:
+            self._solver.add_clause(clause)
+
+    def start_compaction(self):
+        """Start looking for subsumed blocking clauses in the background."""
+        clauses = list(self._blocking)
+        result = []
+
+        def run():
+            result.append(remove_subsumed(clauses))
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        self._compaction = (thread, len(clauses), result)
+
+    def finish_compaction(self):
+        """If a compaction has finished, rebuild the solver without the
+        subsumed clauses it found, or just simplify it if there were none."""
+        thread, count, result = self._compaction
+        if thread.is_alive():
+            return
+        self._compaction = None
+
+        # keep any clauses added since the compaction started, too
+        added = len(self._blocking) - self._seed_clauses
+        kept = result[0] + self._blocking[count:]
+        subsumed = len(self._blocking) - len(kept)
+        self.stats.add_stat('map_subsumed', subsumed)
+        if subsumed:
+            with self.stats.time('map_rebuild'):
+                self._blocking = kept
+                self.replace_solver()
+        else:
+            with self.stats.time('map_simplify'):
+                self._solver.simplify()
+        self._next_compact = 2 * len(self._blocking)
+
+        # seed time per result (i.e., per blocking clause) since the last
+        # compaction, to show how the Map's size affects it
+        seed_time = self.stats.get_times()['seed']
+        self.stats.add_stat('seed_per_result', (seed_time - self._seed_time) / max(1, added))
+        self._seed_time = seed_time
+        self._seed_clauses = len(self._blocking)
+
+    def block_down(self, frompoint, maintain=True):
         """Block down from a given set."""
-        clause = self.complement(frompoint)
-        self.add_clause(clause)
+        clause = self.complement(frompoint).to_array()
+        self.add_clause(clause, maintain)
 
-    def block_up(self, frompoint):
+    def block_up(self, frompoint, maintain=True):
         """Block up from a given set."""
         clause = [-i for i in frompoint]
-        self.add_clause(clause)
+        self.add_clause(clause, maintain)
 
 
 class MinicardMapSolver(MapSolver):
-    def __init__(self, n, bias=True, rand_seed=None):   # bias=True is a high/inclusion/MUS bias; False is a low/exclusion/MSS bias.
-        super(MinicardMapSolver, self).__init__(n, bias)
+    def __init__(self, n, bias=True, rand_seed=None, dump=None):   # bias=True is a high/inclusion/MUS bias; False is a low/exclusion/MSS bias.
+        super(MinicardMapSolver, self).__init__(n, bias, dump)
 
         if bias:
             self.k = n  # initial lower bound on # of True variables
         else:
             self.k = 0
 
-        self._solver = minisolvers.MinicardSolver()
+        self.rand_seed = rand_seed
+        self._size_bounds = []  # AtMost constraints from block_above/below_size()
+        self._bound_assumptions = (None, None)  # (k, assumptions) from the last solve_with_bound()
+        self._solver = self._new_solver()
+
+    def _new_solver(self):
+        solver = minisolvers.MinicardSolver()
 
         # Initialize random seed and randomize variable activity if seed is given
-        if rand_seed is not None:
-            self._solver.set_rnd_seed(rand_seed)
-            self._solver.set_rnd_init_act(True)
+        if self.rand_seed is not None:
+            solver.set_rnd_seed(self.rand_seed)
+            solver.set_rnd_init_act(True)
 
-        while self._solver.nvars() < self.n:
-            self._solver.new_var(self.bias)
+        while solver.nvars() < self.n:
+            solver.new_var(self.bias)
 
         # add "bound-setting" variables
-        while self._solver.nvars() < self.n*2:
-            self._solver.new_var()
+        while solver.nvars() < self.n*2:
+            solver.new_var()
 
         # add cardinality constraint (comment is for high bias, maximal model;
         #                             becomes AtMostK for low bias, minimal model)
@@ -161,13 +436,26 @@ class MinicardMapSolver(MapSolver):
         # and to make AtLeast into an AtMost:
         #   AtLeast([lits], k) ==> AtMost([-lits], #lits-k)
         if self.bias:
-            self._solver.add_atmost([-(x+1) for x in range(self.n * 2)], self.n)
+            solver.add_atmost([-(x+1) for x in range(self.n * 2)], self.n)
         else:
-            self._solver.add_atmost([(x+1) for x in range(self.n * 2)], self.n)
+            solver.add_atmost([(x+1) for x in range(self.n * 2)], self.n)
+
+        for lits, k in self._size_bounds:
+            solver.add_atmost(lits, k)
+
+        return solver
 
     def solve_with_bound(self, k):
         # same assumptions work both for high bias / atleast and for low bias / atmost
-        return self._solver.solve( [-(self.n+x+1) for x in range(k)] + [(self.n+k+x+1) for x in range(self.n-k)] )
+        last_k, assumptions = self._bound_assumptions
+        if k != last_k:
+            assumptions = array.array('i', range(-(self.n+1), -(self.n+k+1), -1))
+            assumptions.extend(range(self.n+k+1, self.n*2+1))
+            self._bound_assumptions = (k, assumptions)
+        extra = self._assumptions + self.cube
+        if extra:
+            assumptions = assumptions + array.array('i', extra)
+        return self._solver.solve(assumptions)
 
     def check_seed(self, seed):
         """Check whether a given seed is still unexplored.
@@ -179,46 +467,71 @@ class MinicardMapSolver(MapSolver):
         Returns:
             True if seed is unexplored (i.e., its corresponding assignment is a model)
         """
-        positive_lits = seed + array.array('i', range(self.n+1, self.n*2+1))
+        self.add_received()
+        positive_lits = array.array('i', seed)
+        if self.bias:
+            positive_lits.extend(range(self.n+1, self.n*2+1))
         ret = self._solver.check_complete(positive_lits)
         return ret
 
+    def set_cube(self, cube):
+        super(MinicardMapSolver, self).set_cube(cube)
+        # the largest (smallest) models in a new cube may be beyond the bound
+        self.k = self.n if self.bias else 0
+
     def next_seed(self):
         '''
-            Find the next *maximum* model.
+            Find the next *maximum* model (or *minimum*, with a low bias).
+
+            Models are only ever removed, so the bound k on their size
+            found by the last call is tried first.  If there is no model
+            within it, the new bound is searched for by galloping away from
+            k (as it tends to move little from one seed to the next) and
+            bisecting once a model is found, skipping ahead to the size of
+            each model found along the way.
         '''
+        self.add_received()
         if self.solve_with_bound(self.k):
             return self.get_seed()
 
-        if self.bias:
-            if not self.solve_with_bound(0):
-                # no more models
-                return None
-            # move to the next bound
-            self.k -= 1
-        else:
-            if not self.solve_with_bound(self.n):
-                # no more models
-                return None
-            # move to the next bound
-            self.k += 1
-
-        while not self.solve_with_bound(self.k):
-            if self.bias:
-                self.k -= 1
+        if not self.solve_with_bound(0 if self.bias else self.n):
+            # no more models
+            return None
+        seed = self.get_seed()
+
+        # Search over the distance d of the bound from the loosest one
+        # (0 for high bias, n for low bias): there are models within
+        # distance good, and none within distance bad.
+        def distance(k):
+            return k if self.bias else self.n - k
+
+        good = distance(len(seed))
+        bad = distance(self.k)
+        step = 1
+        while bad - good > 1:
+            trial = max(bad - step, (good + bad) // 2)
+            if self.solve_with_bound(distance(trial)):
+                seed = self.get_seed()
+                good = distance(len(seed))
             else:
-                self.k += 1
+                bad = trial
+                step *= 2
 
+        self.k = distance(good)
         assert 0 <= self.k <= self.n
 
-        return self.get_seed()
+        return seed
+
+    def add_size_bound(self, lits, k):
+        self._solver.add_atmost(lits, k)
+        self._size_bounds.append((lits, k))
 
     def block_above_size(self, size):
-        self._solver.add_atmost( [(x+1) for x in range(self.n)], size)
+        self.add_size_bound( [(x+1) for x in range(self.n)], size)
         self.k = min(size, self.k)
 
     def block_below_size(self, size):
-        self._solver.add_atmost( [-(x+1) for x in range(self.n)], self.n-size)
+        self.add_size_bound( [-(x+1) for x in range(self.n)], self.n-size)
         self.k = min(size, self.k)
 
 
@@ -226,21 +539,74 @@ class MinisatMapSolver(MapSolver):
     def __init__(self, n, bias=True, rand_seed=None, dump=None):   # bias=True is a high/inclusion/MUS bias; False is a low/exclusion/MSS bias; None is no bias.
         super(MinisatMapSolver, self).__init__(n, bias, dump)
 
-        self._solver = minisolvers.MinisatSolver()
+        self.rand_seed = rand_seed
+        self._solver = self._new_solver()
+
+    def _new_solver(self):
+        solver = minisolvers.MinisatSolver()
 
         # Initialize random seed and randomize variable activity if seed is given
-        if rand_seed is not None:
-            self._solver.set_rnd_seed(rand_seed)
-            self._solver.set_rnd_init_act(True)
+        if self.rand_seed is not None:
+            solver.set_rnd_seed(self.rand_seed)
+            solver.set_rnd_init_act(True)
 
-        while self._solver.nvars() < self.n:
-            self._solver.new_var(self.bias)
+        while solver.nvars() < self.n:
+            solver.new_var(self.bias)
 
         if self.bias is None:
-            self._solver.set_rnd_pol(True)
+            solver.set_rnd_pol(True)
+
+        return solver
 
     def next_seed(self):
-        if self._solver.solve():
+        self.add_received()
+        if self._solver.solve(self._assumptions + self.cube):
             return self.get_seed()
         else:
             return None
+
+
+class ResultIndex(object):
+    """An index of blocked MUSes and MSSes for checking whether a seed is
+    explored without a SAT solve: a seed is explored exactly when it is a
+    superset of a blocked MUS or a subset of a blocked MSS (i.e., its
+    complement is a superset of the MSS's complement).  It has the
+    check_seed(), block_up(), and block_down() methods of a MapSolver, for
+    a map with no other clauses (e.g., for filtering duplicate results).
+
+    The MUSes and the MSSes' complements are kept in utils.SubsetIndex
+    instances, and a seed is explored if some MUS avoids every constraint
+    outside it, or some complement avoids every constraint in it (as a
+    blocked set itself does).
+
+    >>> index = ResultIndex(5)
+    >>> index.block_up([2, 4])
+    >>> index.block_down([1, 2, 3])
+    >>> index.check_seed([1, 2, 4]), index.check_seed([1, 3]), index.check_seed([3, 4])
+    (False, False, True)
+    >>> index.check_seed([2, 4, 1]), index.check_seed([1, 2, 3])
+    (False, False)
+    """
+    def __init__(self, n):
+        self.n = n
+        self._ups = utils.SubsetIndex(n)    # MUSes
+        self._downs = utils.SubsetIndex(n)  # complements of MSSes
+
+    def check_seed(self, seed):
+        """Check whether a given seed is still unexplored.
+
+        Returns:
+            True if seed is unexplored.
+        """
+        point = utils.Bitset.from_seed(self.n, seed)
+        # (each is given the mask of constraints outside the set it checks)
+        return not self._ups.has_subset(point.complement().mask) and \
+            not self._downs.has_subset(point.mask)
+
+    def block_down(self, frompoint):
+        point = utils.Bitset.from_seed(self.n, frompoint)
+        self._downs.add(point.complement())
+
+    def block_up(self, frompoint):
+        point = utils.Bitset.from_seed(self.n, frompoint)
+        self._ups.add(point)
@@ -3,17 +3,23 @@
 
 import argparse
 import atexit
+import binascii
+import collections
 import copy
 import multiprocessing
 import os
 import select
 import signal
+import subprocess
 import sys
 import threading
 
 import utils
 import mapsolvers
+import CNFcache
 import CNFsolvers
+import netcomms
+import resultlog
 from MCSEnumerator import MCSEnumerator
 from MarcoPolo import MarcoPolo
 
@@ -44,6 +50,10 @@ def parse_args():
                         help="bias the search toward MUSes or MCSes early in the execution [default: MUSes] -- all will be enumerated eventually; this just uses heuristics to find more of one or the other early in the enumeration.")
     parser.add_argument('--print-mcses', action='store_true',
                         help="for every satisfiable subset found, print the constraints in its complementary MCS instead of the MSS.")
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help="cache parsed CNF/GCNF instances in CACHE_DIR (keyed by a hash of the input file's contents) so later runs on the same input can skip parsing.")
+    parser.add_argument('--cache-size', type=int, default=4096,
+                        help="limit the size of the instance cache to CACHE_SIZE MB, evicting the least recently used instances as needed [default: 4096].")
     parser.add_argument('--check-muser', action='store_true',
                         help="just run a check of the MUSer2 helper application and exit (used to configure tests).")
 
@@ -55,6 +65,20 @@ def parse_args():
                            help="use same seeds for all children (still randomized but with all seeds of value 1.")
     par_group.add_argument('--all-randomized', action='store_true',
                            help="randomly initialize *all* children in parallel mode (default: first thread is *not* randomly initialized, all others are).")
+    par_group.add_argument('--shrink-jobs', type=int, default=1,
+                           help="shrink up to this many seeds at once, each in its own MUSer2 process, while continuing to find and grow other seeds (within each enumerator, with or without --parallel) [default: 1]")
+    par_group.add_argument('--prefetch-seeds', action='store_true',
+                           help="find each next seed in a background thread while the current one is checked and grown or shrunk (within each enumerator, with or without --parallel).")
+    par_group.add_argument('--comms-log', type=int, default=0, metavar='MB',
+                           help="share results between children through a log in shared memory of this many MB (rather than through the master, which then only reads the log to filter duplicates and print results) [default: 0 (off)]")
+    par_group.add_argument('--cubes', action='store_true',
+                           help="partition the search among the children (cube-and-conquer): each finds seeds only within its own part of the lattice, fixing some constraints in or out, and busy children split their parts to give half to idle ones (MUS and MCS modes only).")
+    par_group.add_argument('--listen', type=str, default=None, metavar='[HOST:]PORT',
+                           help="accept enumerators started with --worker (e.g., on other hosts) as extra children, over TCP (listening on localhost if HOST is not given).  The master then runs until the enumeration is complete, waiting for more workers if none are left.  Set MARCO_AUTHKEY to the same secret for the master and its workers to have them authenticate each other.")
+    par_group.add_argument('--worker', type=str, default=None, metavar='HOST:PORT',
+                           help="run as a child of a master started with --listen at the given address (with the same input file), in the mode set by -b or --mcs-only.")
+    par_group.add_argument('--local-workers', type=str, default=None, metavar='MODES',
+                           help="start --worker children on this host for the given modes (as in --parallel), listening on a free port if not given --listen (to test the TCP transport).")
     comms_group = par_group.add_mutually_exclusive_group()
     comms_group.add_argument('--comms-disable', action='store_true',
                              help="disable the communications between children (i.e., when the master receives a result from a child, it won't send to other children).")
@@ -69,15 +93,33 @@ def parse_args():
                            help="only used if *not* using --parallel: initialize variable activity in solvers to random values (optionally specify a random seed [default: 1 if --rnd-init specified without a seed]).")
     exp_group.add_argument('--improved-implies', action='store_true',
                            help="use improved technique for Map formula implications (implications under assumptions) [default: False, use only singleton MCSes as hard constraints]")
+    exp_group.add_argument('--map-solver', choices=['minisat', 'minicard'], default='minisat',
+                           help="solver for the Map formula: 'minisat' finds maximal (for MUSes) / minimal (for MCSes) seeds; 'minicard' finds maximum / minimum-cardinality seeds with a cardinality constraint, searching for its bound by galloping and bisection (not with --nomax) [default: minisat]")
     exp_group.add_argument('--dump-map', nargs='?', type=argparse.FileType('w'),
                            help="dump clauses added to the Map formula to the given file.")
+    exp_group.add_argument('--rebuild-map', type=int, default=0, metavar='N',
+                           help="rebuild the Map solver after every N blocking clauses, keeping only blocking clauses not subsumed by others (drops learned clauses and retired temporary clauses, so the solver doesn't keep growing over long runs) [default: 0 (never)]")
+    exp_group.add_argument('--compact-map', type=int, default=0, metavar='N',
+                           help="once the Map formula has N blocking clauses (and again whenever that number doubles), look for subsumed blocking clauses in a background thread, then rebuild the Map solver without them (or just simplify it if there are none); with --stats, 'seed_per_result' reports the seed time per result between compactions [default: 0 (never)]")
     solver_group = exp_group.add_mutually_exclusive_group()
     solver_group.add_argument('--force-minisat', action='store_true',
                               help="use Minisat in place of MUSer2 for CNF (NOTE: much slower and usually not worth doing!)")
     solver_group.add_argument('--pmuser', type=int, default=None,
                               help="use MUSer2-para in place of MUSer2 to run in parallel (specify # of threads.)")
+    solver_group.add_argument('--adaptive-shrink', action='store_true',
+                              help="choose MUSer2 or Minisat to shrink each seed, based on its size and running estimates of each one's cost")
     exp_group.add_argument('--nomax', action='store_true',
                            help="perform no model maximization whatsoever (applies either shrink() or grow() to all seeds)")
+    exp_group.add_argument('--python-parser', action='store_true',
+                           help="parse CNF/GCNF input in Python rather than with the native pyminisolvers loader (slower; useful for comparing setup times)")
+    exp_group.add_argument('--shrink-algo', choices=['deletion', 'dichotomic'], default='deletion',
+                           help="algorithm for shrinking seeds to MUSes with Minisat or Z3 (i.e., not with MUSer2): 'deletion' tests one constraint at a time, 'dichotomic' deletes chunks of constraints at a time, halving the chunk size as it goes (QuickXplain-style; fewer solver calls when MUSes are small relative to the seeds) [default: deletion]")
+    exp_group.add_argument('--check-cache', type=int, default=0, metavar='SIZE',
+                           help="remember up to SIZE unsatisfiable cores and SIZE satisfiable subsets found by subset checks, and answer later checks of supersets/subsets of them without calling the solver; with Minisat, shrinking and growing then run their checks in Python rather than natively in pyminisolvers [default: 0 (off)]")
+    exp_group.add_argument('--model-rotation', action='store_true',
+                           help="when shrinking CNF seeds with Minisat (i.e., not with MUSer2), use recursive model rotation on each satisfying assignment found to mark further constraints as critical without testing them")
+    exp_group.add_argument('--harvest-seeds', type=int, default=0, metavar='N',
+                           help="queue up to N of the satisfiable subsets found while shrinking CNF seeds with Minisat (i.e., not with MUSer2) and unsatisfiable cores found while growing them, and use those as seeds before getting more from the map solver [default: 0 (off)]")
 
     args = parser.parse_args()
 
@@ -94,6 +136,14 @@ def parse_args():
             sys.exit(1)
         sys.exit(0)
 
+    if args.map_solver == 'minicard' and args.nomax:
+        sys.stderr.write("--map-solver minicard always finds maximum/minimum seeds; it cannot be used with --nomax.\n")
+        sys.exit(1)
+
+    if args.worker and (args.parallel or args.listen or args.local_workers):
+        sys.stderr.write("--worker cannot be used with --parallel, --listen, or --local-workers.\n")
+        sys.exit(1)
+
     if args.smt and args.infile == sys.stdin:
         sys.stderr.write("SMT cannot be read from STDIN.  Please specify a filename.\n")
         sys.exit(1)
@@ -166,11 +216,39 @@ def setup_execution(args, stats, mainpid):
         atexit.register(at_exit, stats)
 
 
-def setup_csolver(args, seed):
+def is_cnf_input(args):
+    infile = args.infile
+    return args.cnf or infile.name.endswith('.cnf') or infile.name.endswith('.cnf.gz') or infile.name.endswith('.gcnf') or infile.name.endswith('.gcnf.gz')
+
+
+def setup_cache(args):
+    if args.cache_dir:
+        return CNFcache.InstanceCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    else:
+        return None
+
+
+def setup_instance(args):
+    # Parse a CNF/GCNF input once, here, so that parallel children can build
+    # their solvers from the parsed instance (inherited when they are forked)
+    # rather than each reading and parsing the input again.
+    if not is_cnf_input(args):
+        return None
+
+    try:
+        instance = CNFsolvers.read_instance(args.infile, native_parse=not args.python_parser, cache=setup_cache(args))
+    except (IOError, OSError) as e:
+        error_exit("Unable to load pyminisolvers library.", "Run 'make -C pyminisolvers' to compile the library.", e)
+    args.infile.close()
+
+    return instance
+
+
+def setup_csolver(args, seed, instance=None):
     infile = args.infile
 
     # create appropriate constraint solver
-    if args.cnf or infile.name.endswith('.cnf') or infile.name.endswith('.cnf.gz') or infile.name.endswith('.gcnf') or infile.name.endswith('.gcnf.gz'):
+    if is_cnf_input(args):
         if args.force_minisat or args.mcs_only:  # mcs_only doesn't care about fancy features, give it a plain MinisatSubsetSolver
             solverclass = CNFsolvers.MinisatSubsetSolver
         elif args.improved_implies:
@@ -178,13 +256,21 @@ def setup_csolver(args, seed):
         else:
             solverclass = CNFsolvers.MUSerSubsetSolver
 
+        # use the already-parsed instance, if we have one
+        source = instance if instance is not None else infile
+        native_parse = not args.python_parser
         try:
-            if args.mcs_only:
-                csolver = solverclass(infile, seed, store_dimacs=True)
+            cache = setup_cache(args)
+            if args.mcs_only or (args.model_rotation and solverclass is not CNFsolvers.MUSerSubsetSolver):
+                # (MUSerSubsetSolver always stores the clauses)
+                csolver = solverclass(source, seed, store_dimacs=True, native_parse=native_parse, cache=cache)
             elif args.pmuser is not None:
-                csolver = solverclass(infile, seed, numthreads=args.pmuser)
+                csolver = solverclass(source, seed, numthreads=args.pmuser, native_parse=native_parse, cache=cache)
             else:
-                csolver = solverclass(infile, seed)
+                csolver = solverclass(source, seed, native_parse=native_parse, cache=cache)
+            csolver.model_rotation = args.model_rotation
+            if solverclass is CNFsolvers.MUSerSubsetSolver:
+                csolver.adaptive = args.adaptive_shrink
         except utils.ExecutableException as e:
             error_exit("Unable to use MUSer2 for MUS extraction.", "Use --force-minisat to use Minisat instead (NOTE: it will be much slower.)", e)
         except (IOError, OSError) as e:
@@ -206,6 +292,10 @@ def setup_csolver(args, seed):
         )
         sys.exit(1)
 
+    csolver.shrink_algo = args.shrink_algo
+    if args.check_cache > 0:
+        csolver.check_cache = CNFsolvers.CheckCache(csolver.n, args.check_cache)
+
     return csolver
 
 
@@ -217,19 +307,25 @@ def setup_msolver(n, args, seed=None):
         varbias = (args.bias == 'MUSes')  # High bias (True) for MUSes, low (False) for MCSes
 
     try:
-        msolverclass = mapsolvers.MinisatMapSolver
-        if args.parallel:
-            # Synchronize if running in parallel mode
-            msolverclass = utils.synchronize_class(msolverclass)
+        if args.map_solver == 'minicard':
+            msolverclass = mapsolvers.MinicardMapSolver
+        else:
+            msolverclass = mapsolvers.MinisatMapSolver
+        if args.prefetch_seeds:
+            # Synchronize if prefetching seeds (results received in
+            # parallel mode are only queued by their thread; see MapSolver.receive())
+            msolverclass = utils.synchronize_class(msolverclass, exclude=['receive'])
         msolver = msolverclass(n, bias=varbias, rand_seed=seed, dump=args.dump_map)
+        msolver.rebuild_interval = args.rebuild_map
+        msolver.compact_threshold = args.compact_map
     except OSError as e:
         error_exit("Unable to load pyminisolvers library.", "Run 'make -C pyminisolvers' to compile the library.", e)
 
     return msolver
 
 
-def setup_solvers(args, seed=None):
-    csolver = setup_csolver(args, seed)
+def setup_solvers(args, seed=None, instance=None):
+    csolver = setup_csolver(args, seed, instance)
     msolver = setup_msolver(csolver.n, args, seed)
 
     try:
@@ -244,6 +340,10 @@ def setup_config(args):
     config = {}
     config['bias'] = args.bias
     config['comms_ignore'] = args.comms_ignore
+    config['shrink_jobs'] = args.shrink_jobs
+    config['prefetch'] = args.prefetch_seeds
+    config['harvest'] = args.harvest_seeds
+    config['cubes'] = args.cubes
     if args.nomax:
         config['maximize'] = False
     else:
@@ -253,21 +353,40 @@ def setup_config(args):
     return config
 
 
-def run_enumerator(stats, args, seed=None, pipe=None):
-    csolver, msolver = setup_solvers(args, seed)
+def run_enumerator(stats, args, seed=None, pipe=None, instance=None, log=None, source=None):
+    with stats.time('setup'):
+        csolver, msolver = setup_solvers(args, seed, instance)
     config = setup_config(args)
 
+    try:
+        csolver.set_stats(stats)
+    except AttributeError:
+        pass
+    msolver.set_stats(stats)
+
     if args.mcs_only:
         enumerator = MCSEnumerator(csolver, stats, config, pipe)
     else:
         enumerator = MarcoPolo(csolver, msolver, stats, config, pipe)
 
+    if log is not None and not args.comms_disable:
+        # get the other children's results straight from the shared log
+        def follow():
+            for result in log.follow(source, stats):
+                enumerator.receive(result)
+
+        follow_thread = threading.Thread(target=follow)
+        follow_thread.daemon = True
+        follow_thread.start()
+
     # enumerate results in a separate thread so signal handling works while in C code
     # ref: https://thisismiller.github.io/blog/CPython-Signal-Handling/
     def enumerate():
         remaining = args.limit
         for result in enumerator.enumerate():
-            if pipe:
+            if log is not None:
+                log.append(result, source)
+            elif pipe:
                 pipe.send(result)
             else:
                 print_result(result, args, stats, csolver.n)
@@ -289,20 +408,187 @@ def run_enumerator(stats, args, seed=None, pipe=None):
         enumthread.join(float('inf'))
 
 
-def run_master(stats, args, pipes):
+def run_master(stats, args, pipes, n, log=None, listener=None):
     # for filtering duplicate results (found near-simultaneously by 2+ children)
     # and spurious results (if using improved-implies and a child reaches a point that
     # suddenly becomes blocked by new blocking clauses, it could return that incorrectly
     # as an MUS or MCS)
-    # Need to parse the constraint set (again!) just to get n for the map formula...
-    csolver = setup_csolver(args, seed=None)
-    msolver = mapsolvers.MinisatMapSolver(csolver.n)
+    # (an index of the results found so far answers that without a map solver)
+    index = mapsolvers.ResultIndex(n)
     # Old way: results = set()
 
-    remaining = args.limit
+    remaining = [args.limit]
+
+    def terminate_all():
+        # End / cleanup all children
+        for pipe in pipes:
+            pipe.send('terminate')
+        # Exit main process
+        sys.exit(0)
+
+    def handle_result(result, source):
+        assert result[0] in ['U', 'S']
+        # filter out duplicate / spurious results
+        with stats.time('index'):
+            point = utils.Bitset.from_seed(n, result[1])
+            if not index.check_seed(point):
+                if args.verbose > 1:
+                    print("Child (%s) sent duplicate (len: %d)" % (source, len(result[1])))
+                if result[0] == 'U':
+                    stats.increment_counter("duplicate MUS")
+                else:
+                    stats.increment_counter("duplicate MSS")
+
+                # already found/reported/explored
+                return
+
+        with stats.time('index_block'):
+            if result[0] == 'U':
+                index.block_up(point)
+            elif result[0] == 'S':
+                index.block_down(point)
+
+        # Old way to check duplicates:
+        #res_set = frozenset(result[1])
+        #res_set = ",".join(str(x) for x in result[1])
+        #if res_set in results:
+        #    continue
+
+        #results.add(res_set)
+
+        print_result(result, args, stats, n)
+
+        if remaining[0]:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                sys.stderr.write("Result limit reached.\n")
+                terminate_all()
+
+        if log is None and not args.comms_disable:
+            # send it to all children *other* than the one we got it from
+            for other in pipes:
+                if other != source:
+                    other.send(result)
+
+    # With --cubes, the children each explore a cube (a part of the lattice;
+    # see MapSolver.set_cube()).  The whole lattice starts as a single cube,
+    # and whenever a child is idle with no cube to hand it, a busy child is
+    # asked to split its cube (and send back the half it gives up).  Each
+    # cube handed out gets a new id, which the child's messages about it
+    # carry, so a message about a cube the child no longer has is ignored.
+    cubes = collections.deque()  # cubes yet to be handed out
+    working = {}    # child (pipe) -> (id, cube) of its cube
+    idle = []       # children waiting for a cube
+    splitting = {}  # children asked to split -> the ids of their cubes when asked
+    unsplittable = set()  # children that couldn't split their current cubes
+    next_cube_id = [0]
+
+    def hand_out_cubes():
+        while idle and cubes:
+            child = idle.pop()
+            cube = cubes.popleft()
+            next_cube_id[0] += 1
+            working[child] = (next_cube_id[0], cube)
+            unsplittable.discard(child)
+            child.send(('cube', next_cube_id[0], cube))
+
+        if not working and not cubes:
+            # every cube is done
+            if args.verbose > 1:
+                print("All cubes done.")
+            if log is not None:
+                read_log()
+            terminate_all()
+
+        # split the largest cubes (i.e., with the fewest literals) first
+        busy = sorted((child for child in working if child not in splitting and child not in unsplittable),
+                      key=lambda child: len(working[child][1]))
+        for child in busy[:len(idle) - len(splitting)]:
+            cube_id = working[child][0]
+            splitting[child] = cube_id
+            child.send(('split', cube_id))
+
+    def handle_cube_message(msg, child):
+        # (a worker that reconnected may still send messages about the
+        # cube it had before, which has been handed out again; see drop())
+        cube_id = working.get(child, (None, None))[0]
+        if msg[0] == 'cube_done':
+            if msg[1] != cube_id:
+                return
+            stats.increment_counter('cube_done')
+            del working[child]
+            idle.append(child)
+        else:
+            # a reply to 'split': the half the child gave up, if it could split
+            if splitting.get(child) != msg[1]:
+                return
+            del splitting[child]
+            half = msg[2]
+            if msg[1] != cube_id:
+                # (it finished that cube before it was asked, so had nothing to split)
+                assert half is None
+            elif half is not None:
+                working[child] = (cube_id, half[:-1] + [-half[-1]])
+                cubes.append(half)
+            else:
+                unsplittable.add(child)
+        hand_out_cubes()
+
+    def drop(child):
+        # stop using a child whose pipe or connection has closed
+        if child in pipes:
+            pipes.remove(child)
+        if args.cubes:
+            if child in working:
+                # (its cube isn't done, so hand it out again)
+                cubes.append(working.pop(child)[1])
+            if child in idle:
+                idle.remove(child)
+            splitting.pop(child, None)
+            hand_out_cubes()
+
+    def add_workers():
+        # start using any workers that have connected, and keep connections alive
+        for worker in listener.new_workers():
+            if args.verbose > 1:
+                print("Connected to %s." % worker)
+            stats.increment_counter('workers')
+            pipes.append(worker)
+            if args.cubes:
+                idle.append(worker)
+                hand_out_cubes()
+        for child in list(pipes):
+            if isinstance(child, netcomms.WorkerChannel):
+                child.keep_alive()
+                if child.closed:
+                    if args.verbose > 1:
+                        print("Lost %s." % child)
+                    drop(child)
+
+    def read_log():
+        # results in the shared log have already reached the other children
+        for child, result in log.read_master():
+            handle_result(result, "#%d" % child)
+
+    if args.cubes:
+        idle.extend(pipes)
+        cubes.append([])
+        hand_out_cubes()
+
+    # (with a listener, run until the enumeration is complete, even with no
+    # children left for now, as more workers may connect)
+    while (multiprocessing.active_children() and pipes) or listener is not None:
+        if listener is not None:
+            add_workers()
+            ready, _, _ = select.select(pipes, [], [], netcomms.heartbeat_interval)
+        elif log is None:
+            ready, _, _ = select.select(pipes, [], [])
+        else:
+            # wake up now and then to read the log
+            ready, _, _ = select.select(pipes, [], [], 0.01)
+            with stats.time('hubcomms'):
+                read_log()
 
-    while multiprocessing.active_children() and pipes:
-        ready, _, _ = select.select(pipes, [], [])
         with stats.time('hubcomms'):
             for receiver in ready:
                 while receiver.poll():
@@ -312,9 +598,13 @@ def run_master(stats, args, pipes):
                     except EOFError:
                         # Sometimes a closed pipe will still trigger ready and .poll(),
                         # but it then throws an EOFError on .recv().  Handle that here.
-                        pipes.remove(receiver)
+                        drop(receiver)
                         break
 
+                    if result is None:
+                        # (just a heartbeat from a worker)
+                        continue
+
                     if result[0] == 'done':
                         # "done" indicates the child process has finished its work,
                         # but enumeration may not be complete (if the child was only
@@ -325,6 +615,8 @@ def run_master(stats, args, pipes):
                         receiver.send('terminate')
                         # Remove it from the list of active pipes
                         pipes.remove(receiver)
+                        # (and stop reading from it, as it's about to close)
+                        break
 
                     elif result[0] == 'complete':
                         # "complete" indicates the child process has completed enumeration,
@@ -337,64 +629,69 @@ def run_master(stats, args, pipes):
                         #    # Print received stats
                         #    at_exit(result[1])
 
-                        # End / cleanup all children
-                        for pipe in pipes:
-                            pipe.send('terminate')
-                        # Exit main process
-                        sys.exit(0)
+                        if log is not None:
+                            # the child's results were all logged before it sent this
+                            read_log()
+                        terminate_all()
+
+                    elif result[0] in ('cube_done', 'cube'):
+                        handle_cube_message(result, receiver)
 
                     else:
-                        assert result[0] in ['U', 'S']
-                        # filter out duplicate / spurious results
-                        with stats.time('msolver'):
-                            if not msolver.check_seed(result[1]):
-                                if args.verbose > 1:
-                                    print("Child (%s) sent duplicate (len: %d)" % (receiver, len(result[1])))
-                                if result[0] == 'U':
-                                    stats.increment_counter("duplicate MUS")
-                                else:
-                                    stats.increment_counter("duplicate MSS")
-
-                                # already found/reported/explored
-                                continue
-
-                        with stats.time('msolver_block'):
-                            if result[0] == 'U':
-                                msolver.block_up(result[1])
-                            elif result[0] == 'S':
-                                msolver.block_down(result[1])
-
-                        # Old way to check duplicates:
-                        #res_set = frozenset(result[1])
-                        #res_set = ",".join(str(x) for x in result[1])
-                        #if res_set in results:
-                        #    continue
-
-                        #results.add(res_set)
-
-                        print_result(result, args, stats, csolver.n)
-
-                        if remaining:
-                            remaining -= 1
-                            if remaining == 0:
-                                sys.stderr.write("Result limit reached.\n")
-                                # End / cleanup all children
-                                for pipe in pipes:
-                                    pipe.send('terminate')
-                                # Exit main process
-                                sys.exit(0)
-
-                        if not args.comms_disable:
-                            # send it to all children *other* than the one we got it from
-                            for other in pipes:
-                                if other != receiver:
-                                    other.send(result)
+                        handle_result(result, receiver)
+
+    if log is not None:
+        # (children that were 'done' may have logged results after our last read)
+        with stats.time('hubcomms'):
+            read_log()
+
+
+def run_worker(stats, args):
+    link = netcomms.MasterLink(netcomms.parse_address(args.worker), stats, netcomms.authkey())
+    # (the master decides whether its children explore cubes)
+    args.cubes = link.cubes
+    if args.cubes and args.mcs_only:
+        sys.stderr.write("The master uses --cubes, which cannot be used with --mcs-only.\n")
+        sys.exit(1)
+    run_enumerator(stats, args, seed=args.rnd_init, pipe=link)
+
+
+def start_local_workers(args, address, first_index):
+    # Rerun this command as a worker for each mode, minus the master's options.
+    master_opts = ('--parallel', '--listen', '--local-workers', '--comms-log')  # (with values)
+    master_flags = ('--cubes', '--same-seeds', '--all-randomized', '--comms-disable')
+    argv = []
+    skip = False
+    for arg in sys.argv[1:]:
+        if skip:
+            skip = False
+        elif arg in master_opts:
+            skip = True  # (and its value)
+        elif arg not in master_flags and not arg.startswith(tuple(opt + '=' for opt in master_opts)):
+            argv.append(arg)
+
+    mode_flags = {'MUS': ['-b', 'MUSes'], 'MCS': ['-b', 'MCSes'], 'MCSonly': ['--mcs-only']}
+    # (workers' output would be mixed into the master's)
+    with open(os.devnull, 'w') as devnull:
+        for i, mode in enumerate(args.local_workers.split(',')):
+            assert mode in mode_flags, "Invalid worker mode: %s" % mode
+            cmd = [sys.executable, os.path.realpath(__file__)] + argv + mode_flags[mode]
+            cmd += ['--worker', "%s:%d" % address, '--rnd-init', str(first_index + i + 1)]
+            proc = subprocess.Popen(cmd, stdout=devnull)
+            # (one may not have connected before the master finishes, so it
+            # would keep trying to reconnect)
+            atexit.register(stop_local_worker, proc)
+
+
+def stop_local_worker(proc):
+    if proc.poll() is None:
+        proc.terminate()
 
 
 def print_result(result, args, stats, num_constraints):
     if result[0] == 'S' and args.print_mcses:
         # MCS = the complement of the MSS relative to the full set of constraints
-        result = ('C', set(range(1, num_constraints+1)).difference(result[1]))
+        result = ('C', utils.Bitset.from_seed(num_constraints, result[1]).complement())
     output = result[0]
     if args.alltimes:
         output = "%s %0.3f" % (output, stats.total_time())
@@ -408,19 +705,48 @@ def main():
     stats = utils.Statistics()
 
     pipes = []
+    child_pipes = []
     procs = []
 
-    # make process group id match process id so all children
-    # will share the same group id (for easier termination)
-    os.setpgrp()
-
     with stats.time('setup'):
         args = parse_args()
-        setup_execution(args, stats, os.getpid())
-        if args.same_seeds or args.comms_disable:
+
+        # make process group id match process id so all children
+        # will share the same group id (for easier termination)
+        # (a worker stays in the group of any master that started it)
+        if not args.worker:
+            os.setpgrp()
+
+        # (a worker in a master's group then exits on a signal like any child)
+        setup_execution(args, stats, os.getpgrp())
+        if args.same_seeds or args.comms_disable or args.comms_log or args.cubes or args.listen or args.local_workers:
             assert args.parallel is not None, "some flags you have specified have to be tested in the parallel mode."
+        if args.listen or args.local_workers:
+            assert not args.comms_log, "--comms-log cannot be used with TCP workers."
 
         if args.parallel:
+            # Children must be forked (not spawned) so that they inherit the
+            # instance parsed here.
+            try:
+                mp = multiprocessing.get_context('fork')
+            except AttributeError:
+                mp = multiprocessing  # Python 2 always forks
+
+            # Parse the input just once, for all children
+            instance = setup_instance(args)
+            if instance is not None:
+                n = instance.n
+            else:
+                # Need to parse the constraint set just to get n for the master's result index...
+                n = setup_csolver(args, seed=None).n
+
+            if args.comms_log:
+                # (room for at least one result of every size)
+                capacity = max(args.comms_log * 2**20 // 4, n + 3)
+                log = resultlog.ResultLog(capacity, mp)
+            else:
+                log = None
+
             for i, mode in enumerate(args.parallel.split(',')):
                 newargs = copy.copy(args)
                 if mode == 'MUS':
@@ -428,12 +754,14 @@ def main():
                 elif mode == 'MCS':
                     newargs.bias = 'MCSes'
                 elif mode == 'MCSonly':
+                    assert not args.cubes, "--cubes cannot be used with the MCSonly mode."
                     newargs.mcs_only = True
                 else:
                     assert False, "Invalid parallel mode: %s" % mode
 
-                pipe, child_pipe = multiprocessing.Pipe()
+                pipe, child_pipe = mp.Pipe()
                 pipes.append(pipe)
+                child_pipes.append(child_pipe)
 
                 if args.same_seeds:
                     if args.all_randomized:
@@ -447,9 +775,17 @@ def main():
                     else:
                         seed = i+1
 
-                proc = multiprocessing.Process(target=run_enumerator, args=(stats, newargs, seed, child_pipe))
+                proc = mp.Process(target=run_enumerator, args=(stats, newargs, seed, child_pipe, instance, log, i))
                 procs.append(proc)
 
+            if args.listen or args.local_workers:
+                if args.local_workers and not netcomms.authkey():
+                    # (the local workers inherit it)
+                    os.environ[netcomms.AUTHKEY_VAR] = binascii.hexlify(os.urandom(16)).decode()
+                listener = netcomms.WorkerListener(netcomms.parse_address(args.listen or '0'), args.cubes, n, netcomms.authkey())
+            else:
+                listener = None
+
     # useful for timing just the parsing / setup
     if args.limit == 0:
         sys.stderr.write("Result limit reached.\n")
@@ -458,7 +794,15 @@ def main():
     if args.parallel:
         for proc in procs:
             proc.start()
-        run_master(stats, args, pipes)
+        # (so a child's pipe reaches EOF if the child dies)
+        for child_pipe in child_pipes:
+            child_pipe.close()
+        if args.local_workers:
+            start_local_workers(args, listener.address, len(procs))
+        run_master(stats, args, pipes, n, log, listener)
+
+    elif args.worker:
+        run_worker(stats, args)
 
     else:
         run_enumerator(stats, args, seed=args.rnd_init)
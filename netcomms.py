@@ -0,0 +1,434 @@
+"""A TCP transport between marco_py's master and enumerators on other hosts.
+
+The master (with --listen) accepts connections from workers (marco.py
+--worker HOST:PORT, run with the same input file), and talks to each through
+a WorkerChannel, which works like the end of a multiprocessing.Pipe it
+shares with a local child.  A worker talks to the master through a
+MasterLink, which works like the child's end.
+
+Messages are framed by multiprocessing.connection (a length prefix), and
+each is a type byte followed by any little-endian int32 payload (never
+pickled):
+    b'U' / b'S' + seed      a result, ('U', MUS) or ('S', MSS)
+    b'C' + id, literals     ('cube', id, cube); b'N' + id is ('cube', id, None)
+    b'P' + id               ('split', id)
+    b'D' + id               ('cube_done', id)
+    b'd' / b'c'             ('done', None) / ('complete', None) (no stats)
+    b'T'                    'terminate'
+    b'W' + version, cubes   the master's greeting to a new worker
+    b'H'                    a worker's heartbeat (never returned by recv())
+    b'H' + count            the master's heartbeat, acknowledging the first
+                            count results and 'done'/'complete' messages
+                            received over the connection
+
+The master checks every frame a worker sends, and drops a worker that
+sends a malformed one.  Setting MARCO_AUTHKEY in the environment of the
+master and its workers to the same secret makes them authenticate each
+other when they connect (see multiprocessing.connection); otherwise
+anyone who can reach the master's port can join.
+
+Each side sends a heartbeat every heartbeat_interval seconds and gives up
+on a connection it hasn't heard from in heartbeat_timeout seconds.  A
+worker then reconnects (as a new worker, to the master) and sends again
+the results and any 'done' or 'complete' message the master hadn't
+acknowledged, as they may have been lost; the master filters out any
+duplicate results.
+"""
+import array
+import collections
+import os
+import sys
+import threading
+import time
+from multiprocessing import connection
+
+VERSION = 1
+
+heartbeat_interval = 1.0
+heartbeat_timeout = 10.0
+reconnect_timeout = 60.0  # how long a worker keeps trying to reconnect
+
+_INTSIZE = 4
+_BIG_ENDIAN = sys.byteorder == 'big'
+_CODES = {'U': b'U', 'S': b'S', 'cube': b'C', 'split': b'P', 'cube_done': b'D',
+          'done': b'd', 'complete': b'c'}
+_NAMES = dict((code, name) for name, code in _CODES.items())
+_NAMES[b'T'] = 'terminate'
+_NAMES[b'N'] = 'cube'
+_WORKER_CODES = (b'U', b'S', b'C', b'N', b'D', b'd', b'c')  # (what a worker may send)
+_ACKED = ('U', 'S', 'done', 'complete')  # (what the master acknowledges, and a worker resends until it does)
+
+AUTHKEY_VAR = 'MARCO_AUTHKEY'
+
+
+def parse_address(address, default_host='localhost'):
+    """Split "[HOST:]PORT" into a (host, port) tuple."""
+    host, _, port = address.rpartition(':')
+    return (host or default_host, int(port))
+
+
+def authkey():
+    """Get the key to authenticate connections with, from the environment,
+    or None if none is set."""
+    key = os.environ.get(AUTHKEY_VAR)
+    return key.encode() if key else None
+
+
+def _pack_ints(ints):
+    a = array.array('i', ints)
+    assert a.itemsize == _INTSIZE
+    if _BIG_ENDIAN:
+        a.byteswap()
+    # (Python 2's array has tostring() in place of tobytes())
+    return a.tobytes() if hasattr(a, 'tobytes') else a.tostring()
+
+
+def _unpack_ints(data):
+    a = array.array('i')
+    if hasattr(a, 'frombytes'):
+        a.frombytes(data)
+    else:
+        a.fromstring(data)  # Python 2
+    if _BIG_ENDIAN:
+        a.byteswap()
+    return a.tolist()
+
+
+def encode(msg):
+    """Encode a message as a frame.
+
+    >>> encode(('U', [1, 2])) == b'U' + b'\\x01\\x00\\x00\\x00\\x02\\x00\\x00\\x00'
+    True
+    >>> [decode(encode(msg)) for msg in [('S', []), ('cube', 7, [3, -4]), ('cube', 7, None), ('split', 7), 'terminate']]
+    [('S', []), ('cube', 7, [3, -4]), ('cube', 7, None), ('split', 7), 'terminate']
+    """
+    if msg == 'terminate':
+        return b'T'
+    name = msg[0]
+    if name in ('U', 'S'):
+        return _CODES[name] + _pack_ints(msg[1])
+    if name == 'cube':
+        if msg[2] is None:
+            return b'N' + _pack_ints([msg[1]])
+        return b'C' + _pack_ints([msg[1]] + msg[2])
+    if name in ('split', 'cube_done'):
+        return _CODES[name] + _pack_ints([msg[1]])
+    return _CODES[name]
+
+
+def decode(frame, n=None):
+    """Decode a frame (other than a heartbeat or greeting) as a message.
+
+    Args:
+        frame: The frame.
+        n: If given, the number of constraints, to check the literals
+           against.
+
+    Raises:
+        ValueError: If the frame is malformed.
+
+    >>> decode(b'D\\x07\\x00\\x00\\x00')
+    ('cube_done', 7)
+    >>> decode(b'U\\x01\\x02')
+    Traceback (most recent call last):
+    ValueError: Frame payload is not a whole number of ints.
+    >>> decode(encode(('U', [3, 11])), n=10)
+    Traceback (most recent call last):
+    ValueError: Constraint 11 out of range.
+    """
+    code, payload = frame[:1], frame[1:]
+    name = _NAMES.get(code)
+    if name is None:
+        raise ValueError("Unknown frame type.")
+    if len(payload) % _INTSIZE != 0:
+        raise ValueError("Frame payload is not a whole number of ints.")
+    ints = _unpack_ints(payload)
+
+    if code in (b'T', b'd', b'c'):
+        ids, lits = 0, None
+    elif code in (b'N', b'P', b'D'):
+        ids, lits = 1, None
+    elif code == b'C':
+        ids, lits = 1, ints[1:]
+    else:  # a result
+        ids, lits = 0, ints
+    if len(ints) < ids or (lits is None and len(ints) != ids):
+        raise ValueError("Wrong payload size for the frame type.")
+    for lit in lits or []:
+        if lit == 0 or (lit < 0 and code != b'C') or (n is not None and abs(lit) > n):
+            raise ValueError("Constraint %d out of range." % lit)
+
+    if code == b'T':
+        return 'terminate'
+    if code == b'N':
+        return ('cube', ints[0], None)
+    if name == 'cube':
+        return (name, ints[0], lits)
+    if ids:
+        return (name, ints[0])
+    if lits is not None:
+        return (name, lits)
+    return (name, None)
+
+
+class WorkerChannel(object):
+    """The master's end of a connection to a worker, used like the end of a
+    Pipe to a local child.  After the connection fails (or the worker goes
+    quiet for too long, or sends a malformed frame), closed is set, and
+    recv() raises EOFError."""
+    def __init__(self, conn, address, cubes, n):
+        self._conn = conn
+        self.address = address
+        self.n = n  # the number of constraints (for checking frames)
+        self.closed = False
+        self._last_heard = time.time()
+        self._last_beat = 0.0
+        self._received = 0  # messages in _ACKED received (acknowledged in heartbeats)
+        self._send_frame(b'W' + _pack_ints([VERSION, int(cubes)]))
+
+    def __repr__(self):
+        return "worker %s:%d" % self.address
+
+    def fileno(self):
+        return self._conn.fileno()
+
+    def _send_frame(self, frame):
+        if self.closed:
+            return
+        try:
+            self._conn.send_bytes(frame)
+        except (IOError, OSError):
+            self.close()
+
+    def send(self, msg):
+        self._send_frame(encode(msg))
+
+    def poll(self, timeout=0.0):
+        if self.closed:
+            return True  # (so recv() raises EOFError)
+        try:
+            return self._conn.poll(timeout)
+        except (IOError, OSError, EOFError):
+            self.close()
+            return True
+
+    def recv(self):
+        """Receive a message, or None if it was just a heartbeat."""
+        if self.closed:
+            raise EOFError
+        try:
+            frame = self._conn.recv_bytes()
+        except (IOError, OSError, EOFError):
+            self.close()
+            raise EOFError
+        self._last_heard = time.time()
+        if frame == b'H':
+            return None
+        try:
+            if frame[:1] not in _WORKER_CODES:
+                raise ValueError("Unexpected frame type.")
+            msg = decode(frame, self.n)
+        except ValueError as e:
+            sys.stderr.write("Dropping %s after a malformed frame: %s\n" % (self, e))
+            self.close()
+            raise EOFError
+        if msg[0] in _ACKED:
+            self._received += 1
+        return msg
+
+    def keep_alive(self):
+        """Send a heartbeat, if one is due, and close the connection if the
+        worker has been quiet too long.  (Call this regularly.)"""
+        now = time.time()
+        if now - self._last_heard > heartbeat_timeout:
+            self.close()
+        elif now - self._last_beat >= heartbeat_interval:
+            # (sent even when other messages are, for the acknowledgment)
+            self._send_frame(b'H' + _pack_ints([self._received]))
+            self._last_beat = now
+
+    def close(self):
+        self.closed = True
+        try:
+            self._conn.close()
+        except (IOError, OSError):
+            pass
+
+
+class WorkerListener(object):
+    """Accepts workers' connections in a background thread."""
+    def __init__(self, address, cubes, n, authkey=None):
+        self._listener = connection.Listener(address, authkey=authkey)
+        self.address = self._listener.address  # (with the port chosen, if given port 0)
+        self._cubes = cubes
+        self._n = n
+        self._new = []
+        self._lock = threading.Lock()
+        accept_thread = threading.Thread(target=self._accept)
+        accept_thread.daemon = True
+        accept_thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except (IOError, OSError, EOFError, connection.AuthenticationError):
+                continue  # (e.g., a client without the key)
+            channel = WorkerChannel(conn, self._listener.last_accepted, self._cubes, self._n)
+            with self._lock:
+                self._new.append(channel)
+
+    def new_workers(self):
+        """Return the channels to any workers connected since the last call."""
+        with self._lock:
+            new, self._new = self._new, []
+        return new
+
+
+class MasterLink(object):
+    """A worker's end of its connection to the master, used like a local
+    child's end of its Pipe: send() from one thread, and poll() and recv()
+    from another.  It sends heartbeats, and reconnects if the connection
+    fails (resending the results and 'done' or 'complete' message the master
+    hasn't acknowledged); if it can't, the worker exits."""
+    def __init__(self, address, stats, authkey=None):
+        self.address = address
+        self.stats = stats
+        self._authkey = authkey
+        self.cubes = False  # whether the master partitions the lattice (see MarcoPolo)
+        self._lock = threading.Lock()  # for sending and reconnecting
+        # (the receiving thread mustn't wait for a sender blocked on a full
+        # socket, so acknowledgments take only this lock, never held for I/O)
+        self._ack_lock = threading.Lock()
+        self._unacked = collections.deque()  # frames of the messages in _ACKED sent but not acknowledged, in order
+        self._acked = 0  # messages acknowledged over _ack_conn
+        self._ack_conn = None
+        self._conn = None
+        self._last_heard = 0.0
+        with self._lock:
+            self._connect()
+
+        heartbeat_thread = threading.Thread(target=self._heartbeat)
+        heartbeat_thread.daemon = True
+        heartbeat_thread.start()
+
+    def _connect(self):
+        # (called with the lock held)
+        deadline = time.time() + reconnect_timeout
+        with self._ack_lock:
+            # (the messages not acknowledged may have been lost with an old connection)
+            resend = list(self._unacked)
+        while True:
+            try:
+                conn = connection.Client(self.address, authkey=self._authkey)
+                greeting = conn.recv_bytes()
+                for frame in resend:
+                    conn.send_bytes(frame)
+                break
+            except connection.AuthenticationError:
+                sys.stderr.write("The master at %s:%d did not accept this worker's key (see %s).\n" % (self.address + (AUTHKEY_VAR,)))
+                sys.stderr.flush()
+                os._exit(1)
+            except (IOError, OSError, EOFError):
+                if time.time() > deadline:
+                    sys.stderr.write("Lost the master at %s:%d.\n" % self.address)
+                    sys.stderr.flush()
+                    os._exit(1)  # (the enumerator's threads can't be stopped otherwise)
+                time.sleep(heartbeat_interval)
+
+        if greeting[:1] != b'W' or len(greeting) != 1 + 2 * _INTSIZE:
+            # (a master with a key sends a challenge first)
+            sys.stderr.write("%s:%d is not a master, or it requires a key (see %s).\n" % (self.address + (AUTHKEY_VAR,)))
+            sys.stderr.flush()
+            os._exit(1)
+        version, cubes = _unpack_ints(greeting[1:])
+        if version != VERSION:
+            sys.stderr.write("The master at %s:%d uses protocol version %d, not %d.\n" % (self.address + (version, VERSION)))
+            sys.stderr.flush()
+            os._exit(1)
+        self.cubes = bool(cubes)
+        self._conn = conn
+        with self._ack_lock:
+            self._ack_conn = conn
+            self._acked = 0
+        self._last_heard = time.time()
+
+    def _replace(self, conn):
+        # Reconnect after conn failed, unless it's been replaced already.
+        # (called with the lock held)
+        if self._conn is conn:
+            self.stats.increment_counter('reconnect')
+            with self._ack_lock:
+                self._ack_conn = None  # (ignore any late acknowledgments over conn)
+            try:
+                conn.close()
+            except (IOError, OSError):
+                pass
+            self._connect()
+
+    def _send_frame(self, frame, keep=False):
+        with self._lock:
+            if keep:
+                with self._ack_lock:
+                    self._unacked.append(frame)
+            while True:
+                conn = self._conn
+                try:
+                    conn.send_bytes(frame)
+                    return
+                except (IOError, OSError):
+                    self._replace(conn)
+                    if keep or frame == b'H':
+                        return  # (resent on reconnecting, or not needed)
+
+    def send(self, msg):
+        self._send_frame(encode(msg), keep=msg != 'terminate' and msg[0] in _ACKED)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(heartbeat_interval)
+            self._send_frame(b'H')
+
+    def _ack(self, conn, count):
+        # the master has received the first count messages in _ACKED sent over conn
+        with self._ack_lock:
+            if self._ack_conn is conn:
+                for _ in range(count - self._acked):
+                    self._unacked.popleft()
+                self._acked = count
+
+    def _failed(self, conn):
+        with self._lock:
+            self._replace(conn)
+
+    def poll(self, timeout=None):
+        """Wait for a message (forever, with timeout None), reconnecting
+        if the master goes quiet for too long."""
+        start = time.time()
+        while True:
+            conn = self._conn
+            try:
+                if conn.poll(heartbeat_interval):
+                    return True
+            except (IOError, OSError, EOFError):
+                self._failed(conn)
+                continue
+            if time.time() - self._last_heard > heartbeat_timeout:
+                self._failed(conn)
+            if timeout is not None and time.time() - start >= timeout:
+                return False
+
+    def recv(self):
+        """Receive a message, skipping heartbeats."""
+        while True:
+            conn = self._conn
+            try:
+                frame = conn.recv_bytes()
+            except (IOError, OSError, EOFError):
+                self._failed(conn)
+                continue
+            self._last_heard = time.time()
+            if frame[:1] != b'H':
+                return decode(frame)
+            if len(frame) > 1:
+                self._ack(conn, _unpack_ints(frame[1:])[0])
@@ -1,4 +1,5 @@
 #include "minicard/minicard/Solver.h"
+#include "utils/ParseUtils.h"
 
 using namespace Minisat;
 
@@ -12,6 +13,35 @@ inline int Littoi(Lit l) {
     return (var(l)+1) * (sign(l) ? -1 : 1);
 }
 
+// Parse an integer for loadDimacs(), reporting failure instead of exiting
+// as Minisat's own parseInt() does.
+template<class B>
+static bool readInt(B& in, int& val) {
+    bool neg = false;
+    val = 0;
+    skipWhitespace(in);
+    if      (*in == '-') neg = true, ++in;
+    else if (*in == '+') ++in;
+    if (*in < '0' || *in > '9') return false;
+    while (*in >= '0' && *in <= '9') {
+        val = val*10 + (*in - '0');
+        ++in;
+    }
+    if (neg) val = -val;
+    return true;
+}
+
+// Error codes returned by loadDimacs()
+enum { DIMACS_OK = 0, DIMACS_OPEN_ERROR = 1, DIMACS_PARSE_ERROR = 2, DIMACS_COUNT_ERROR = 3 };
+
+// Clauses kept by loadDimacs() (in file order) for copying out with DimacsStore_fill()
+struct DimacsStore {
+    vec<int> lits;      // all literals of all clauses, 0-terminators removed
+    vec<int> offs;      // clause i is lits[offs[i]] to lits[offs[i+1]-1]
+    vec<int> groups;    // group of clause i (0 = hard)
+    DimacsStore() { offs.push(0); }
+};
+
 extern "C" {
     Solver* Solver_new() { return new Solver(); }
     void Solver_delete(Solver* s) { delete s; }
@@ -32,8 +62,13 @@ extern "C" {
     // Initialize the solver's random seed
     void setRndSeed(Solver* s, double seed) { assert(seed != 0.0); s->random_seed = seed; }
 
-    // polarity: 0=False, 1=True, 2=Undef
-    int newVar(Solver* s, uint8_t polarity, bool dvar=true) { return s->newVar(polarity, dvar); }
+    // polarity: 0=False, 1=True, 2=Undef (as lbool values of the literal's *sign*,
+    // i.e., MiniSat's user polarity, which every decision on the variable follows)
+    int newVar(Solver* s, uint8_t polarity, bool dvar=true) {
+        Var v = s->newVar(true, dvar);
+        s->setUserPolarity(v, lbool(polarity));
+        return v;
+    }
 
     bool addAtMost(Solver* s, int len, int* lits, int k) {
         vec<Lit> atmost;
@@ -128,6 +163,20 @@ extern "C" {
         return len;
     }
 
+    // propagates any pending top-level assignments (via simplify()) and
+    // returns the number of literals on the top-level trail (i.e., all 0-level
+    // assignments), or -1 if the formula is unsatisfiable
+    int trailSize(Solver* s) {
+        return s->simplify() ? s->nAssigns() : -1;
+    }
+
+    // fills an array w/ the literals on the top-level trail from start to end
+    void getTrail(Solver* s, int start, int end, int* lits) {
+        for (int i = start ; i < end ; i++) {
+            lits[i-start] = Littoi(s->trailLit(i));
+        }
+    }
+
     // fills an array w/ any literals known to be implied by the current formula
     // and any given assumptions (i.e., all 0-level assignments)
     // returns number of elements in the filled array
@@ -144,4 +193,304 @@ extern "C" {
         }
         return len;
     }
+
+    // Parse a DIMACS CNF or GCNF file (optionally gzipped) and add all of its
+    // clauses directly: clauses in group 0 ("Don't care") are added as hard
+    // clauses, and every other clause is instrumented with the relaxation
+    // variable for its group (nvars + group-1, 0-based).  Instance variables
+    // are created with an undefined polarity, relaxation variables with
+    // polarity True (as in CNFsolvers.MinisatSubsetSolver.parse_dimacs()).
+    // Fills counts with [nvars, nclauses, n] (n = number of soft constraints)
+    // and returns DIMACS_OK or one of the error codes above.  If store is not
+    // NULL, every clause is also recorded in it (see DimacsStore_fill()).
+    int loadDimacs(Solver* s, const char* filename, int* counts, DimacsStore* store) {
+        gzFile f = gzopen(filename, "rb");
+        if (f == NULL) return DIMACS_OPEN_ERROR;
+        StreamBuffer* in = new StreamBuffer(f);
+
+        int ret = DIMACS_OK;
+        int nvars = -1, nclauses = 0, n = 0;
+        bool gcnf_in = false;
+        int i = 0;
+        vec<Lit> clause;
+
+        for (;;) {
+            skipWhitespace(*in);
+            if (isEof(*in)) break;
+
+            if (**in == 'c') {
+                skipLine(*in);
+                continue;
+            }
+
+            if (**in == 'p') {
+                ++*in;
+                skipWhitespace(*in);
+                if (**in == 'g') {
+                    gcnf_in = true;
+                    ++*in;
+                }
+                if (!eagerMatch(*in, "cnf")) {
+                    ret = DIMACS_PARSE_ERROR;
+                    break;
+                }
+                if (!readInt(*in, nvars) || !readInt(*in, nclauses)) {
+                    ret = DIMACS_PARSE_ERROR;
+                    break;
+                }
+                if (gcnf_in) {
+                    if (!readInt(*in, n)) {
+                        ret = DIMACS_PARSE_ERROR;
+                        break;
+                    }
+                }
+                else {
+                    n = nclauses;
+                }
+                if (nvars < 0 || nclauses < 0 || n < 0) {
+                    ret = DIMACS_PARSE_ERROR;
+                    break;
+                }
+
+                while (s->nVars() < nvars) {
+                    newVar(s, 2);  // l_Undef
+                }
+                while (s->nVars() < nvars + n) {
+                    newVar(s, 1);  // default relaxation variables to *enable* clauses
+                }
+                skipLine(*in);
+                continue;
+            }
+
+            // anything else is a clause
+            if (nvars < 0) {
+                // clause before the header
+                ret = DIMACS_PARSE_ERROR;
+                break;
+            }
+
+            if (i >= nclauses) {
+                // more clauses than the header declared (and, for plain
+                // CNF, than there are relaxation variables for)
+                ret = DIMACS_COUNT_ERROR;
+                break;
+            }
+
+            int groupid = i+1;
+            if (gcnf_in) {
+                // "parse" the '{x}' group ID
+                if (**in != '{') { ret = DIMACS_PARSE_ERROR; break; }
+                ++*in;
+                if (!readInt(*in, groupid) || **in != '}') { ret = DIMACS_PARSE_ERROR; break; }
+                ++*in;
+                if (groupid < 0 || groupid > n) { ret = DIMACS_PARSE_ERROR; break; }
+            }
+
+            clause.clear();
+            if (groupid > 0) {
+                clause.push( ~mkLit(nvars + groupid-1) );
+            }
+            int lit;
+            for (;;) {
+                if (!readInt(*in, lit)) { ret = DIMACS_PARSE_ERROR; break; }
+                if (lit == 0) break;
+                if (lit > nvars || -lit > nvars) { ret = DIMACS_PARSE_ERROR; break; }
+                clause.push( itoLit(lit) );
+            }
+            if (ret != DIMACS_OK) break;
+
+            s->addClause(clause);
+            if (store != NULL) {
+                for (int k = (groupid > 0) ; k < clause.size() ; k++) {
+                    store->lits.push( Littoi(clause[k]) );
+                }
+                store->offs.push( store->lits.size() );
+                store->groups.push( groupid );
+            }
+            i++;
+        }
+
+        delete in;
+        gzclose(f);
+
+        if (ret == DIMACS_OK && (nvars < 0 || i != nclauses)) {
+            ret = DIMACS_COUNT_ERROR;
+        }
+
+        counts[0] = nvars;
+        counts[1] = nclauses;
+        counts[2] = n;
+        return ret;
+    }
+
+    DimacsStore* DimacsStore_new() { return new DimacsStore(); }
+    void DimacsStore_delete(DimacsStore* d) { delete d; }
+
+    // fills sizes with [number of literals, number of clauses]
+    void DimacsStore_sizes(DimacsStore* d, int* sizes) {
+        sizes[0] = d->lits.size();
+        sizes[1] = d->groups.size();
+    }
+
+    // Copy the stored clauses out as a flat clause arena sorted (stably) by
+    // group: clause j is lits[clause_offs[j]] to lits[clause_offs[j+1]-1],
+    // and group g holds clauses group_offs[g] to group_offs[g+1]-1.
+    // clause_offs needs room for nclauses+1 entries, group_offs for ngroups+1.
+    void DimacsStore_fill(DimacsStore* d, int ngroups, int* lits, int* clause_offs, int* group_offs) {
+        int nclauses = d->groups.size();
+
+        // counting sort of clauses by group
+        for (int g = 0 ; g <= ngroups ; g++) {
+            group_offs[g] = 0;
+        }
+        for (int i = 0 ; i < nclauses ; i++) {
+            group_offs[d->groups[i]+1]++;
+        }
+        for (int g = 0 ; g < ngroups ; g++) {
+            group_offs[g+1] += group_offs[g];
+        }
+        vec<int> order(nclauses);
+        vec<int> next(ngroups);
+        for (int g = 0 ; g < ngroups ; g++) {
+            next[g] = group_offs[g];
+        }
+        for (int i = 0 ; i < nclauses ; i++) {
+            order[next[d->groups[i]]++] = i;
+        }
+
+        int pos = 0;
+        clause_offs[0] = 0;
+        for (int j = 0 ; j < nclauses ; j++) {
+            int i = order[j];
+            for (int k = d->offs[i] ; k < d->offs[i+1] ; k++) {
+                lits[pos++] = d->lits[k];
+            }
+            clause_offs[j+1] = pos;
+        }
+    }
+
+    // Add all clauses from a clause arena (as filled by DimacsStore_fill()):
+    // clauses in group 0 are added as hard clauses, and clauses in group g > 0
+    // are instrumented with relaxation variable nvars+g-1 (0-based).
+    void addClauseStore(Solver* s, int nvars, int ngroups, const int* lits, const int* clause_offs, const int* group_offs) {
+        vec<Lit> clause;
+        for (int g = 0 ; g < ngroups ; g++) {
+            for (int j = group_offs[g] ; j < group_offs[g+1] ; j++) {
+                clause.clear();
+                if (g > 0) {
+                    clause.push( ~mkLit(nvars + g-1) );
+                }
+                for (int k = clause_offs[j] ; k < clause_offs[j+1] ; k++) {
+                    clause.push( itoLit(lits[k]) );
+                }
+                s->addClause(clause);
+            }
+        }
+    }
+
+    // Deletion-based shrink of an UNSAT subset of the soft constraints to an
+    // MUS, with clause-set refinement: whenever a check is UNSAT, the subset
+    // is reduced to the solver's core.  Constraints are given as 0-based
+    // indexes plus offset.  Constraints listed in hard are never tested for
+    // removal (entries outside the range of soft constraints, e.g. negative
+    // literals, are ignored).  Writes the result into subset (in increasing
+    // order) and returns its size.
+    int shrinkSubset(Solver* s, int nv, int nrel, int* subset, int len, const int* hard, int hardlen, int offset) {
+        vec<char> in(nrel, 0);
+        vec<char> is_hard(nrel, 0);
+        vec<int> seed(len);
+        for (int j = 0 ; j < len ; j++) {
+            seed[j] = subset[j] - offset;
+            in[seed[j]] = 1;
+        }
+        for (int j = 0 ; j < hardlen ; j++) {
+            int idx = hard[j] - offset;
+            if (idx >= 0 && idx < nrel) is_hard[idx] = 1;
+        }
+
+        vec<Lit> assumptions;
+        for (int j = 0 ; j < len ; j++) {
+            int i = seed[j];
+            if (!in[i] || is_hard[i]) {
+                // may have been "also-removed"
+                continue;
+            }
+            in[i] = 0;
+
+            assumptions.clear();
+            for (int k = 0 ; k < len ; k++) {
+                if (in[seed[k]]) assumptions.push( mkLit(nv + seed[k]) );
+            }
+            if (s->solve(assumptions)) {
+                in[i] = 1;
+            }
+            else {
+                // remove any also-removed constraints
+                for (int k = 0 ; k < len ; k++) {
+                    in[seed[k]] = 0;
+                }
+                for (int k = 0 ; k < s->conflict.size() ; k++) {
+                    in[var(s->conflict[k]) - nv] = 1;
+                }
+            }
+        }
+
+        int count = 0;
+        for (int i = 0 ; i < nrel ; i++) {
+            if (in[i]) subset[count++] = i + offset;
+        }
+        return count;
+    }
+
+    // Grow a SAT subset of the soft constraints to an MSS: tries adding each
+    // other constraint in turn (in increasing order), keeping it if the
+    // result is still satisfiable, in which case every other constraint
+    // satisfied by the new model is added as well.  Constraints are given as
+    // 0-based indexes plus offset, and those listed in exclude are never
+    // added (entries outside the range of soft constraints are ignored).
+    // subset must have room for nrel entries.  Writes the result into subset
+    // (in increasing order) and returns its size.
+    int growSubset(Solver* s, int nv, int nrel, int* subset, int len, const int* exclude, int exclen, int offset) {
+        vec<char> in(nrel, 0);
+        vec<char> excluded(nrel, 0);
+        for (int j = 0 ; j < len ; j++) {
+            in[subset[j] - offset] = 1;
+        }
+        for (int j = 0 ; j < exclen ; j++) {
+            int idx = exclude[j] - offset;
+            if (idx >= 0 && idx < nrel) excluded[idx] = 1;
+        }
+
+        // the subset only ever grows, so its assumptions can be kept incrementally
+        vec<Lit> assumptions;
+        for (int k = 0 ; k < nrel ; k++) {
+            if (in[k]) assumptions.push( mkLit(nv + k) );
+        }
+        for (int x = 0 ; x < nrel ; x++) {
+            if (in[x] || excluded[x]) {
+                // skip any included by an earlier model
+                continue;
+            }
+            assumptions.push( mkLit(nv + x) );
+            if (s->solve(assumptions)) {
+                in[x] = 1;
+                // add any also-satisfied constraints
+                for (int k = x+1 ; k < nrel ; k++) {
+                    if (!in[k] && !excluded[k] && s->modelValue(nv + k) == l_True) {
+                        in[k] = 1;
+                        assumptions.push( mkLit(nv + k) );
+                    }
+                }
+            }
+            else {
+                assumptions.pop();
+            }
+        }
+
+        int count = 0;
+        for (int i = 0 ; i < nrel ; i++) {
+            if (in[i]) subset[count++] = i + offset;
+        }
+        return count;
+    }
 }
@@ -130,6 +130,7 @@ Var Solver::newVar(bool sign, bool dvar)
     activity .push(rnd_init_act ? drand(random_seed) * 0.00001 : 0);
     seen     .push(0);
     polarity .push(sign);
+    user_pol .push(l_Undef);
     decision .push();
     trail    .capacity(v+1);
     setDecisionVar(v, dvar);
@@ -374,7 +375,13 @@ Lit Solver::pickBranchLit()
         }else
             next = order_heap.removeMin();
 
-    return next == var_Undef ? lit_Undef : mkLit(next, rnd_pol ? drand(random_seed) < 0.5 : polarity[next]);
+    // Choose polarity based on different polarity modes (global or per-variable):
+    if (next == var_Undef)
+        return lit_Undef;
+    else if (user_pol[next] != l_Undef)
+        return mkLit(next, user_pol[next] == l_True);
+    else
+        return mkLit(next, rnd_pol ? drand(random_seed) < 0.5 : polarity[next]);
 }
 
 
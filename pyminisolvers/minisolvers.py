@@ -24,11 +24,11 @@ import array
 import os
 import ctypes  # type: ignore
 from abc import ABCMeta, abstractmethod
-from ctypes import c_void_p, c_ubyte, c_bool, c_int, c_double  # type: ignore
+from ctypes import c_void_p, c_ubyte, c_bool, c_int, c_double, c_char_p  # type: ignore
 
 try:
     import typing  # noqa: for mypy-lang type-checking
-    from typing import Iterable, Sequence, Tuple  # noqa: for mypy-lang type-checking
+    from typing import Iterable, Optional, Sequence, Tuple, Union  # noqa: for mypy-lang type-checking
 except ImportError:
     # not needed at runtime, so no error
     pass
@@ -108,21 +108,45 @@ class Solver(object):
         l.getImplies.restype = c_int
         l.getImplies_assumptions.argtypes = [c_void_p, c_void_p, c_void_p, c_int]
         l.getImplies_assumptions.restype = c_int
+        l.trailSize.argtypes = [c_void_p]
+        l.trailSize.restype = c_int
+        l.getTrail.argtypes = [c_void_p, c_int, c_int, c_void_p]
+        l.getTrail.restype = None
+
+        l.loadDimacs.argtypes = [c_void_p, c_char_p, c_void_p, c_void_p]
+        l.loadDimacs.restype = c_int
+        l.DimacsStore_new.restype = c_void_p
+        l.DimacsStore_new.argtypes = []
+        l.DimacsStore_delete.argtypes = [c_void_p]
+        l.DimacsStore_sizes.argtypes = [c_void_p, c_void_p]
+        l.DimacsStore_fill.argtypes = [c_void_p, c_int, c_void_p, c_void_p, c_void_p]
+        l.addClauseStore.argtypes = [c_void_p, c_int, c_int, c_void_p, c_void_p, c_void_p]
+
+        l.shrinkSubset.argtypes = [c_void_p, c_int, c_int, c_void_p, c_int, c_void_p, c_int, c_int]
+        l.shrinkSubset.restype = c_int
+        l.growSubset.argtypes = [c_void_p, c_int, c_int, c_void_p, c_int, c_void_p, c_int, c_int]
+        l.growSubset.restype = c_int
 
     def __del__(self):  # type: () -> None
         """Delete the Solver object"""
         self.lib.Solver_delete(self.s)
 
     @staticmethod
-    def _to_intptr(a):  # type: (array.array) -> Tuple[int, int]
-        """Helper function to get a ctypes POINTER(c_int) for an array"""
-        addr, size = a.buffer_info()
+    def _to_intptr(a):  # type: (Union[array.array, memoryview]) -> Tuple[int, int]
+        """Helper function to get a ctypes POINTER(c_int) for an array
+        (or a writable memoryview of C ints, e.g. over an mmap)"""
+        if isinstance(a, memoryview):
+            size = len(a)
+            addr = ctypes.addressof(c_int.from_buffer(a)) if size else 0  # (NULL)
+        else:
+            addr, size = a.buffer_info()
         return ctypes.cast(addr, ctypes.POINTER(c_int)), size
 
     @staticmethod
-    def _get_array(seq):  # type: (Iterable[int]) -> array.array
-        """Helper function to turn any iterable into an array (unless it already is one)"""
-        if isinstance(seq, array.array):
+    def _get_array(seq):  # type: (Iterable[int]) -> Union[array.array, memoryview]
+        """Helper function to turn any iterable into an array (unless it
+        already is one, or is a memoryview that can be used as one)"""
+        if isinstance(seq, (array.array, memoryview)):
             return seq
         else:
             return array.array('i', seq)
@@ -192,7 +216,8 @@ class Solver(object):
             A boolean value returned from MiniSat's ``addClause()`` function,
             indicating success (True) or conflict (False).
         """
-        if not all(abs(x) <= self.nvars() for x in lits):
+        nvars = self.nvars()
+        if not all(abs(x) <= nvars for x in lits):
             raise Exception("Not all variables in %s are created yet.  Call new_var() first." % lits)
         if len(lits) > 1:
             a = self._get_array(lits)
@@ -253,6 +278,25 @@ class Solver(object):
         '''Call Solver.simplify().'''
         return self.lib.simplify(self.s)
 
+    # whether release_var() lets a variable be reused
+    recycles_vars = False
+
+    def release_var(self, lit):  # type: (int) -> None
+        """Permanently assert a literal whose variable is no longer needed
+        (e.g., to retire the activation literal of a temporary clause).
+
+        MinisatSolver also removes the clauses this satisfies and reuses the
+        variable in a later `new_var()` once the solver next simplifies
+        (as it does during `solve()`); other solvers just add the literal as
+        a unit clause.
+
+        Args:
+            lit:
+              A literal as an integer, specified as in `add_clause()`.  Its
+              variable must not already be assigned at the top level.
+        """
+        self.add_clause([lit])
+
     def get_model(self, start=0, end=-1):  # type: (int, int) -> array.array
         """Get the current model from the solver, optionally retrieving only a slice.
 
@@ -329,6 +373,32 @@ class Solver(object):
         # reduce the array down to just the valid indexes
         return res[:count]
 
+    def top_level_trail(self, start=0):  # type: (int) -> Optional[array.array]
+        """Get the literals assigned at the top level (i.e., implied by the
+        current formula, as with `implies()`), in the order they were
+        assigned, from the given index in that sequence on.  Any pending
+        top-level propagation is done first, via `simplify()`.
+
+        The sequence only grows as clauses are added (so callers can read
+        just what's new each time), except that MinisatSolver's
+        `simplify()` drops variables released by `release_var()` from it.
+
+        Args:
+            start (int):
+              Optional index of the first literal to get.
+
+        Returns:
+            An array of literals, or None if the formula is unsatisfiable.
+        """
+        end = self.lib.trailSize(self.s)
+        if end < 0:
+            return None
+        res = array.array('i', [0]) * max(0, end - start)
+        if end > start:
+            res_ptr, _ = self._to_intptr(res)
+            self.lib.getTrail(self.s, start, end, res_ptr)
+        return res
+
 
 class SubsetMixin(Solver):
     """A mixin for any Solver class that lets it reason about subsets of a clause set."""
@@ -361,16 +431,160 @@ class SubsetMixin(Solver):
         instrumented_clause.extend(lits)
         self.add_clause(instrumented_clause)
 
-    def solve_subset(self, subset, extra_assumps=None):  # type: (Sequence[int], Sequence[int]) -> bool
+    def load_dimacs(self, filename, store=False):  # type: (str, bool) -> Tuple[int, int, int, Optional[Tuple[array.array, array.array, array.array]]]
+        """Read a DIMACS CNF or GCNF file (optionally gzipped) and add all of
+        its clauses to the solver in a single call.  Clauses in group 0 of a
+        GCNF file are added as hard clauses; every other clause (or group) is
+        added as a soft constraint, as with `add_clause_instrumented()`.  All
+        variables (instance variables and relaxation variables) are created,
+        and `set_varcounts()` is called with the file's counts.
+
+        Args:
+            filename (str):
+                The name of the file to read.
+            store (bool):
+                If True, also return the clauses themselves as a flat clause
+                arena (see below).
+
+        Returns:
+            A tuple (nvars, nclauses, n, clauses) of the number of variables,
+            the number of clauses, the number of soft constraints, and either
+            None or (if store is True) a tuple of three arrays (lits,
+            clause_offs, group_offs), with clauses sorted by group: clause j
+            is ``lits[clause_offs[j]:clause_offs[j+1]]``, and group g (0 for
+            hard clauses) holds clauses ``group_offs[g]`` through
+            ``group_offs[g+1]-1``.
+        """
+        fname_bytes = filename if isinstance(filename, bytes) else filename.encode()
+        counts = array.array('i', [-1] * 3)
+        counts_ptr, _ = self._to_intptr(counts)
+        dstore = self.lib.DimacsStore_new() if store else None
+        try:
+            ret = self.lib.loadDimacs(self.s, fname_bytes, counts_ptr, dstore)
+            if ret == 1:
+                raise IOError("Unable to open DIMACS file: %s" % fname_bytes.decode())
+            elif ret != 0:
+                raise Exception("Error parsing DIMACS file: %s" % fname_bytes.decode())
+
+            nvars, nclauses, n = counts
+            self.set_varcounts(nvars, n)
+
+            clauses = None
+            if store:
+                sizes = array.array('i', [-1] * 2)
+                sizes_ptr, _ = self._to_intptr(sizes)
+                self.lib.DimacsStore_sizes(dstore, sizes_ptr)
+                lits = array.array('i', [0]) * sizes[0]
+                clause_offs = array.array('i', [0]) * (sizes[1] + 1)
+                group_offs = array.array('i', [0]) * (n + 2)
+                self.lib.DimacsStore_fill(dstore, n + 1, self._to_intptr(lits)[0], self._to_intptr(clause_offs)[0], self._to_intptr(group_offs)[0])
+                clauses = (lits, clause_offs, group_offs)
+        finally:
+            if dstore is not None:
+                self.lib.DimacsStore_delete(dstore)
+
+        return nvars, nclauses, n, clauses
+
+    def add_clause_store(self, lits, clause_offs, group_offs):  # type: (Union[array.array, memoryview], Union[array.array, memoryview], Union[array.array, memoryview]) -> None
+        """Add all clauses from a flat clause arena, as returned by
+        `load_dimacs()`, in a single call.  Group 0 is added as hard clauses,
+        and group g > 0 is instrumented as soft constraint g-1.  All
+        variables must already be created.
+
+        Args:
+            lits, clause_offs, group_offs:
+                Arrays (or other buffers of C ints) specifying the clauses as
+                described in `load_dimacs()`.
+        """
+        if self._origvars is None:
+            raise Exception("SubsetSolver.set_varcounts() must be called before .add_clause_store()")
+        ngroups = len(group_offs) - 1
+        if self._origvars + ngroups - 1 > self.nvars():
+            raise Exception("Not all relaxation variables are created yet.  Call new_var() first.")
+        lits = self._get_array(lits)
+        clause_offs = self._get_array(clause_offs)
+        group_offs = self._get_array(group_offs)
+        self.lib.addClauseStore(self.s, self._origvars, ngroups, self._to_intptr(lits)[0], self._to_intptr(clause_offs)[0], self._to_intptr(group_offs)[0])
+
+    def shrink_subset(self, subset, hard=None, offset=0):  # type: (Iterable[int], Optional[Iterable[int]], int) -> array.array
+        """Shrink an UNSAT subset of the soft constraints to a minimal UNSAT
+        subset (MUS) with a deletion-based algorithm run entirely within the
+        solver library.  Each constraint is tested for removal in the order
+        given; whenever a test is UNSAT, the subset is reduced to the unsat
+        core found (clause-set refinement).
+
+        Args:
+            subset:
+                An iterable of the indexes of the soft constraints in an
+                unsatisfiable subset.
+            hard:
+                An optional iterable of indexes of constraints known to be in
+                every MUS within the subset (e.g., implied by a map solver),
+                which are never tested for removal.  Indexes outside the range
+                of soft constraints (e.g., negative literals) are ignored.
+            offset (int):
+                Optional offset by which all given and returned indexes differ
+                from the zero-based indexes used in the solver.
+
+        Returns:
+            An array of constraint indexes (in increasing order) comprising
+            an MUS.
+        """
+        if self._origvars is None:
+            raise Exception("SubsetSolver.set_varcounts() must be called before .shrink_subset()")
+        a = array.array('i', subset)  # always a copy, as the result is written into it
+        a_ptr, size = self._to_intptr(a)
+        h = self._get_array(hard if hard is not None else [])
+        h_ptr, h_size = self._to_intptr(h)
+        count = self.lib.shrinkSubset(self.s, self._origvars, self._relvars, a_ptr, size, h_ptr, h_size, offset)
+        return a[:count]
+
+    def grow_subset(self, subset, exclude=None, offset=0):  # type: (Iterable[int], Optional[Iterable[int]], int) -> array.array
+        """Grow a SAT subset of the soft constraints to a maximal satisfiable
+        subset (MSS) within the solver library.  Every other constraint is
+        tested for addition in increasing order; whenever a test is SAT,
+        all constraints satisfied by its model are added as well.
+
+        Args:
+            subset:
+                An iterable of the indexes of the soft constraints in a
+                satisfiable subset.
+            exclude:
+                An optional iterable of indexes of constraints that should
+                never be added.  Indexes outside the range of soft constraints
+                (e.g., negative literals) are ignored.
+            offset (int):
+                Optional offset by which all given and returned indexes differ
+                from the zero-based indexes used in the solver.
+
+        Returns:
+            An array of constraint indexes (in increasing order) comprising
+            an MSS.
+        """
+        if self._origvars is None:
+            raise Exception("SubsetSolver.set_varcounts() must be called before .grow_subset()")
+        a = array.array('i', subset)  # always a copy, as the result is written into it
+        size = len(a)
+        a.extend(array.array('i', [0]) * (self._relvars - size))
+        a_ptr, _ = self._to_intptr(a)
+        e = self._get_array(exclude if exclude is not None else [])
+        e_ptr, e_size = self._to_intptr(e)
+        count = self.lib.growSubset(self.s, self._origvars, self._relvars, a_ptr, size, e_ptr, e_size, offset)
+        return a[:count]
+
+    def solve_subset(self, subset, extra_assumps=None, offset=0):  # type: (Iterable[int], Sequence[int], int) -> bool
         """Solve a subset of the constraints containing all "hard" clauses
         (those added with the regular `add_clause()` method) and the
         specified subset of soft constraints.
 
         Args:
             subset:
-                A sequence of the indexes of any soft constraints to be included.
+                An iterable of the indexes of any soft constraints to be included.
             extra_assumps:
                 An optional sequence of extra literals to use when solving.
+            offset (int):
+                Optional offset by which all given indexes differ from the
+                zero-based indexes used in the solver.
 
         Returns:
             True if the given subset is satisfiable, False otherwise.
@@ -378,7 +592,8 @@ class SubsetMixin(Solver):
         if self._origvars is None:
             raise Exception("SubsetSolver.set_varcounts() must be called before .solve_subset()")
 
-        assumptions = array.array('i', [i+self._origvars+1 for i in subset])
+        base = self._origvars + 1 - offset
+        assumptions = array.array('i', [i+base for i in subset])
         if extra_assumps:
             assumptions.extend(extra_assumps)
         a_ptr, size = self._to_intptr(assumptions)
@@ -467,6 +682,24 @@ class MinisatSolver(Solver):
     def __init__(self):  # type: () -> None
         super(MinisatSolver, self).__init__("libminisat.so")
 
+    def _setup_lib(self, libfilename):  # type: (str) -> None
+        """Correct return types (if not int as assumed by ctypes) and set argtypes for
+           functions from the minisat library.
+        """
+        super(MinisatSolver, self)._setup_lib(libfilename)
+
+        # additional function for minisat
+        l = self.lib
+        l.releaseVar.argtypes = [c_void_p, c_int]
+        l.releaseVar.restype = None
+
+    recycles_vars = True
+
+    def release_var(self, lit):  # type: (int) -> None
+        if abs(lit) > self.nvars():
+            raise Exception("Variable %d has not been created yet." % abs(lit))
+        self.lib.releaseVar(self.s, lit)
+
 
 class MinicardSolver(Solver):
     """A Python analog to MiniCard's Solver class.
@@ -542,7 +775,8 @@ class MinicardSolver(Solver):
             A boolean value returned from MiniCard's ``addAtMost()``
             function, indicating success (True) or conflict (False).
         """
-        if not all(abs(x) <= self.nvars() for x in lits):
+        nvars = self.nvars()
+        if not all(abs(x) <= nvars for x in lits):
             raise Exception("Not all variables in %s are created yet.  Call new_var() first." % lits)
 
         if len(lits) > 1:
@@ -675,9 +909,10 @@ class MinicardSubsetSolver(SubsetMixin, MinicardSolver):
         """
         if self._origvars is None:
             raise Exception("SubsetSolver.set_varcounts() must be called before .add_atmost_instrumented()")
-        if not all(abs(x) <= self.nvars() for x in lits):
+        nvars = self.nvars()
+        if not all(abs(x) <= nvars for x in lits):
             raise Exception("Not all variables in %s are created yet.  Call new_var() first." % lits)
-        if self._origvars+1+index > self.nvars():
+        if self._origvars+1+index > nvars:
             raise Exception("Relaxation variable %i has not been created yet.  Call new_var() first." % (self._origvars+1+index))
 
         numlits = len(lits)
@@ -1,7 +1,29 @@
+import gzip
 import minisolvers
+import os
+import tempfile
 import unittest
 
 
+def check_preferred_polarity(test, solver):
+    # Every decision follows a variable's preferred polarity, whatever phase
+    # saving would pick, so each model is maximal (no further variable can be
+    # made True along with those already True).
+    for i in range(6):
+        solver.new_var(True)
+    for cl in ([-1, -2], [-3, -4, -5], [-2, -6]):
+        solver.add_clause(cl)
+    for assumps in ([-1, -3], [-2, -4, -5], [-6], [-1, -3, -4]):
+        # (leave saved phases of False behind)
+        test.assertTrue(solver.solve(assumps))
+    test.assertTrue(solver.solve())
+    m = solver.get_model()
+    true_vars = [i+1 for i in range(6) if m[i]]
+    for i in range(1, 7):
+        if i not in true_vars:
+            test.assertFalse(solver.solve(true_vars + [i]))
+
+
 class MinisatTest(unittest.TestCase):
     def setUp(self):
         self.solver = minisolvers.MinisatSolver()
@@ -19,6 +41,9 @@ class MinisatTest(unittest.TestCase):
     def test_add_clause_without_vars(self):
         self.assertRaises(Exception, self.solver.add_clause, [-1, 2])
 
+    def test_preferred_polarity(self):
+        check_preferred_polarity(self, self.solver)
+
     def add_subset(self, subset):
         for i in range(self.numvars):
             self.solver.new_var()
@@ -60,6 +85,36 @@ class MinisatTest(unittest.TestCase):
         implications = self.solver.implies([5])
         self.assertEqual(set(implications), set([1,-2,5,4,6]))
 
+    def test_top_level_trail(self):
+        self.add_subset(self.clauses[:2])
+        self.assertEqual(list(self.solver.top_level_trail()), [1, -2])
+        for cl in self.clauses[2:-1]:
+            self.solver.add_clause(cl)
+        self.assertEqual(list(self.solver.top_level_trail(2)), [])
+        self.solver.add_clause([-3])
+        self.assertEqual(list(self.solver.top_level_trail(2)), [-3, 4, 6])
+        self.assertEqual(set(self.solver.top_level_trail()), set(self.solver.implies()))
+        self.solver.add_clause([-6])
+        self.assertEqual(self.solver.top_level_trail(), None)
+
+    def test_release_var(self):
+        self.add_subset(self.clauses[:-1])
+        # a temporary clause, active only when its activation var is assumed
+        act = self.solver.new_var() + 1
+        self.solver.add_clause([-act, -3])
+        self.assertEqual(self.solver.solve([act, 3]), False)
+        self.solver.release_var(-act)
+        self.assertEqual(self.solver.solve([3]), True)
+        # simplify() removes the clause and frees the variable (once there
+        # have been enough propagations since it last did so)
+        for i in range(10):
+            self.assertEqual(self.solver.solve(), True)
+            self.solver.simplify()
+        # the variable is reused
+        self.assertEqual(self.solver.new_var() + 1, act)
+        self.assertEqual(self.solver.solve([act, 3]), True)
+        self.assertEqual(self.solver.nvars(), act)
+
 
 class MinisatSubsetTest(unittest.TestCase):
     def setUp(self):
@@ -89,6 +144,37 @@ class MinisatSubsetTest(unittest.TestCase):
         self.assertEqual(self.solver.solve_subset(range(self.n-1), extra_assumps=[2]), False)
         for i in range(1, self.n):
             self.assertEqual(self.solver.solve_subset(range(self.n-i)), True)
+        # 1-based indexes
+        self.assertEqual(self.solver.solve_subset(range(1, self.n+1), offset=1), False)
+        self.assertEqual(self.solver.solve_subset(range(1, self.n), offset=1), True)
+
+    def check_mus(self, mus):
+        self.assertEqual(self.solver.solve_subset(mus), False)
+        for i in mus:
+            self.assertEqual(self.solver.solve_subset([x for x in mus if x != i]), True)
+
+    def check_mss(self, mss):
+        self.assertEqual(self.solver.solve_subset(mss), True)
+        for i in range(self.n):
+            if i not in mss:
+                self.assertEqual(self.solver.solve_subset(list(mss) + [i]), False)
+
+    def test_shrink(self):
+        mus = self.solver.shrink_subset(range(self.n))
+        self.assertEqual(list(mus), sorted(mus))
+        self.check_mus(mus)
+        # same, with 1-based indexes and a (necessary) hard constraint
+        mus1 = self.solver.shrink_subset(range(1, self.n+1), hard=[-1, mus[0]+1], offset=1)
+        self.check_mus([i-1 for i in mus1])
+
+    def test_grow(self):
+        mss = self.solver.grow_subset([])
+        self.assertEqual(list(mss), sorted(mss))
+        self.check_mss(mss)
+        # excluded constraints are never added
+        grown = self.solver.grow_subset([], exclude=[mss[0]+1], offset=1)
+        self.assertTrue(mss[0]+1 not in grown)
+        self.assertEqual(self.solver.solve_subset([i-1 for i in grown]), True)
 
 
 class MinicardTest(unittest.TestCase):
@@ -110,6 +196,9 @@ class MinicardTest(unittest.TestCase):
     def test_add_clause_without_vars(self):
         self.assertRaises(Exception, self.solver.add_clause, [-1, 2])
 
+    def test_preferred_polarity(self):
+        check_preferred_polarity(self, self.solver)
+
     def make_vars(self):
         for i in range(self.numvars):
             self.solver.new_var()
@@ -209,5 +298,81 @@ class MinicardSubsetTest(unittest.TestCase):
         self.assertEqual(sorted(core3), [2, 3])
 
 
+class LoadDimacsTest(unittest.TestCase):
+    cnf = b"c a comment\np cnf 3 4\n1 0\n-2 0\n-1 2 3 0\n\n-3 0\n"
+    gcnf = b"p gcnf 3 5 3\n{0} 1 0\n{1} -2 0\n{2} -1 2 3 0\n{3} -3 0\n{3} 2 3 0\n"
+
+    def setUp(self):
+        self.tmpfiles = []
+
+    def tearDown(self):
+        for name in self.tmpfiles:
+            os.remove(name)
+
+    def write_tmp(self, data, suffix, compress=False):
+        fd, name = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        self.tmpfiles.append(name)
+        opener = gzip.open if compress else open
+        with opener(name, 'wb') as f:
+            f.write(data)
+        return name
+
+    def check_cnf(self, solver, name):
+        self.assertEqual(solver.load_dimacs(name), (3, 4, 4, None))
+        self.assertEqual(solver.nvars(), 3 + 4)
+        self.assertEqual(solver.solve_subset([0, 1, 2, 3]), False)
+        self.assertEqual(sorted(solver.unsat_core()), [0, 1, 2, 3])
+        self.assertEqual(solver.solve_subset([0, 1, 2]), True)
+
+    def test_cnf(self):
+        self.check_cnf(minisolvers.MinisatSubsetSolver(), self.write_tmp(self.cnf, '.cnf'))
+
+    def test_cnf_gz(self):
+        self.check_cnf(minisolvers.MinisatSubsetSolver(), self.write_tmp(self.cnf, '.cnf.gz', compress=True))
+
+    def test_cnf_minicard(self):
+        self.check_cnf(minisolvers.MinicardSubsetSolver(), self.write_tmp(self.cnf, '.cnf'))
+
+    def test_gcnf(self):
+        solver = minisolvers.MinisatSubsetSolver()
+        self.assertEqual(solver.load_dimacs(self.write_tmp(self.gcnf, '.gcnf')), (3, 5, 3, None))
+        self.assertEqual(solver.nvars(), 3 + 3)
+        # group 0 is hard, so {1} and {2} together force 3, which {3} forbids
+        self.assertEqual(solver.solve_subset([0, 1, 2]), False)
+        self.assertEqual(solver.solve_subset([0, 1]), True)
+        self.assertEqual(solver.solve_subset([2]), True)
+
+    def test_store(self):
+        solver = minisolvers.MinisatSubsetSolver()
+        gcnf = b"p gcnf 3 5 3\n{3} -3 0\n{1} -2 0\n{0} 1 0\n{3} 2 3 0\n{2} -1 2 3 0\n"
+        nvars, nclauses, n, clauses = solver.load_dimacs(self.write_tmp(gcnf, '.gcnf'), store=True)
+        lits, clause_offs, group_offs = clauses
+        self.assertEqual(list(group_offs), [0, 1, 2, 3, 5])
+        self.assertEqual(list(clause_offs), [0, 1, 2, 5, 6, 8])
+        self.assertEqual(list(lits), [1, -2, -1, 2, 3, -3, 2, 3])
+
+        # a fresh solver built from the stored clauses behaves the same
+        other = minisolvers.MinicardSubsetSolver()
+        other.set_varcounts(nvars, n)
+        for i in range(nvars + n):
+            other.new_var()
+        other.add_clause_store(lits, clause_offs, group_offs)
+        for subset in [0, 1, 2], [0, 1], [2], [1, 2]:
+            self.assertEqual(other.solve_subset(subset), solver.solve_subset(subset))
+
+    def test_errors(self):
+        solver = minisolvers.MinisatSubsetSolver()
+        self.assertRaises(IOError, solver.load_dimacs, os.path.join(tempfile.gettempdir(), 'no_such_file.cnf'))
+        self.assertRaises(Exception, solver.load_dimacs, self.write_tmp(b"p cnf 2 2\n1 2 0\n", '.cnf'))
+        self.assertRaises(Exception, solver.load_dimacs, self.write_tmp(b"p cnf 2 1\n1 3 0\n", '.cnf'))
+
+    def test_too_many_clauses(self):
+        # (clauses past the header's count have no relaxation variables)
+        name = self.write_tmp(b"p cnf 2 1\n1 2 0\n-1 0\n-2 0\n1 0\n", '.cnf')
+        for solver in minisolvers.MinisatSubsetSolver(), minisolvers.MinicardSubsetSolver():
+            self.assertRaises(Exception, solver.load_dimacs, name)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,161 @@
+"""A shared-memory log of results for parallel marco_py.
+
+Instead of sending each result to the master over its pipe, for the master
+to send on to every other child, each child appends its results to one
+ResultLog, and every process reads them from it directly: each child
+follows the log to block the other children's results, and the master
+reads it to filter duplicates and print the results.
+
+The log is a ring buffer of C ints, with one record per result:
+    kind (0 = 'U', 1 = 'S'), source (the child's index), size, seed[size]
+Positions in the log count ints written since the start, so they only
+grow.  Writers never overwrite records the master hasn't read yet (they
+wait for it instead), but a child that falls more than a full buffer
+behind skips ahead to the master's position, losing the records in
+between.  That's harmless: a result it never blocks may be found again,
+but the master filters out such duplicates.
+
+Readers following the log poll it without taking its lock: a child may
+be killed at any time once the master has told it to terminate, and it
+must not take the lock down with it.  Writers take the lock to wait for
+room, and the master takes it to wake them after reading, but neither
+does so once a child may be killed: a child only appends while it's
+enumerating, and the master stops reading when it terminates them.
+"""
+import array
+import multiprocessing
+import time
+
+_KINDS = ('U', 'S')
+_HEADER = 3  # ints before each record's seed
+
+
+class ResultLog(object):
+    """A log of results shared by the master and its children.
+
+    In a tiny log (of 8 ints), the second record wraps around the end of
+    the buffer, and a third must wait for the master to read it:
+
+    >>> import threading, utils
+    >>> log = ResultLog(8)
+    >>> log.append(('U', [1, 2]), 0)
+    >>> log.read_master()
+    [(0, ('U', [1, 2]))]
+    >>> log.append(('S', [3, 4, 5]), 1)
+    >>> writer = threading.Thread(target=log.append, args=(('U', [6, 7]), 0))
+    >>> writer.start(); writer.join(0.2); writer.is_alive()
+    True
+    >>> log.read_master()
+    [(1, ('S', [3, 4, 5]))]
+    >>> writer.join(); log.read_master()
+    [(0, ('U', [6, 7]))]
+
+    A child following it from the start finds those records overwritten,
+    so it skips ahead to the first record the master hasn't read:
+
+    >>> stats = utils.Statistics()
+    >>> follower = log.follow(1, stats)
+    >>> log.append(('U', [8]), 0)
+    >>> next(follower), stats.get_counts()['log_skipped']
+    (('U', [8]), 1)
+    """
+    def __init__(self, capacity, mp=multiprocessing):
+        """Create a log.  It must be created before the processes that
+        share it are forked.
+
+        Args:
+            capacity: The size of the buffer, in C ints.
+            mp: The multiprocessing module or context to allocate with.
+        """
+        self.capacity = capacity
+        self._buf = mp.RawArray('i', capacity)
+        self._reserved = mp.RawValue('q', 0)  # end of the records being written
+        self._tail = mp.RawValue('q', 0)     # end of the last complete record
+        self._master = mp.RawValue('q', 0)   # how far the master has read
+        self._cond = mp.Condition()          # for writers waiting for room
+
+    def append(self, result, source):
+        """Append a result, ('U', MUS) or ('S', MSS), from a given child,
+        waiting for the master to catch up first if the buffer is full."""
+        kind, seed = result
+        rec = array.array('i', [_KINDS.index(kind), source, 0])
+        rec.extend(seed)
+        rec[2] = len(rec) - _HEADER
+        size = len(rec)
+        if size > self.capacity:
+            raise ValueError("Result of size %d does not fit in a log of %d ints." % (rec[2], self.capacity))
+
+        with self._cond:
+            while self._tail.value + size - self._master.value > self.capacity:
+                self._cond.wait(0.1)
+            # (readers check this after copying, to see if they were overwritten)
+            self._reserved.value = self._tail.value + size
+            start = self._tail.value % self.capacity
+            first = min(size, self.capacity - start)
+            self._buf[start:start + first] = rec[:first]
+            if first < size:
+                self._buf[0:size - first] = rec[first:]
+            self._tail.value += size
+
+    def _read(self, pos, end):
+        """Get the ints in [pos, end), or None if they've been overwritten."""
+        start = pos % self.capacity
+        stop = start + (end - pos)
+        if stop <= self.capacity:
+            ints = self._buf[start:stop]
+        else:
+            ints = self._buf[start:self.capacity] + self._buf[0:stop - self.capacity]
+        if pos < self._reserved.value - self.capacity:
+            return None
+        return ints
+
+    @staticmethod
+    def _records(ints):
+        i = 0
+        while i < len(ints):
+            kind, source, size = ints[i:i + _HEADER]
+            i += _HEADER
+            yield source, (_KINDS[kind], ints[i:i + size])
+            i += size
+
+    def read_master(self):
+        """Read the records appended since the master's last call (only
+        to be called by the master).
+
+        Returns:
+            A list of (source, result) pairs.
+        """
+        pos = self._master.value
+        end = self._tail.value
+        if pos == end:
+            return []
+        records = list(self._records(self._read(pos, end)))
+        with self._cond:
+            self._master.value = end
+            self._cond.notify_all()  # wake any writers waiting for room
+        return records
+
+    def follow(self, source, stats=None, interval=0.005):
+        """Yield the results appended by every child other than the given
+        one, polling every interval seconds for more, forever (for a
+        child's thread).  If the child falls too far behind, the records it
+        missed are counted as 'log_skipped' in stats, if given."""
+        pos = 0
+        while True:
+            end = self._tail.value
+            if end == pos:
+                time.sleep(interval)
+                continue
+
+            ints = self._read(pos, end)
+            if ints is None:
+                # overwritten: skip ahead to a record the master has yet to read
+                if stats is not None:
+                    stats.increment_counter('log_skipped')
+                pos = self._master.value
+                continue
+            pos = end
+
+            for rec_source, result in self._records(ints):
+                if rec_source != source:
+                    yield result
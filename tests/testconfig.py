@@ -2,8 +2,10 @@
 # Syntax: Python
 
 import glob
+import os
 import subprocess
 import sys
+import tempfile
 
 interpreter = sys.executable  # use whatever interpreter is running this script
 cmd = '../marco.py'
@@ -40,6 +42,9 @@ except ImportError:
 
 rnd3sat_files = glob.glob('3sat_n10/*.cnf')
 
+# instance cache directory for --cache-dir tests
+cache_dir = os.path.join(tempfile.gettempdir(), 'marco_test_cache')
+
 jobs = [
     # Random 3SAT
     {
@@ -66,6 +71,106 @@ jobs = [
       'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
       'default': True,
     },
+    # --python-parser
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--python-parser', '--parallel MUS,MCSonly --python-parser'],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --cache-dir (the first run on each file fills the cache; later runs load from it)
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--cache-dir %s' % cache_dir, '--cache-dir %s --force-minisat' % cache_dir, '--cache-dir %s --parallel MUS,MCSonly' % cache_dir],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --shrink-algo, --model-rotation
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--force-minisat --shrink-algo dichotomic', '--improved-implies --shrink-algo dichotomic',
+                 '--force-minisat --model-rotation', '--force-minisat --model-rotation --shrink-algo dichotomic', '--improved-implies --model-rotation'],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --rebuild-map, --compact-map
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--rebuild-map 5', '--rebuild-map 5 --parallel MUS,MCS', '--compact-map 5', '--compact-map 5 --parallel MUS,MCS'],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --check-cache
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--force-minisat --check-cache 64', '--improved-implies --check-cache 64', '--force-minisat --shrink-algo dichotomic --check-cache 64'],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --prefetch-seeds
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--force-minisat --prefetch-seeds', '--improved-implies --prefetch-seeds', '--force-minisat --prefetch-seeds --parallel MUS,MCS'],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
+    # TCP workers (--local-workers)
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--parallel MUS --local-workers MCS', '--parallel MUS,MCS --local-workers MUS,MCSonly', '--parallel MUS --local-workers MUS,MCS --cubes'],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --cubes
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--parallel MUS,MCS --cubes', '--parallel MUS,MUS,MCS,MCS --cubes', '--parallel MUS,MCS --cubes --comms-disable', '--parallel MUS,MUS,MCS --cubes --prefetch-seeds'],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --comms-log
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--parallel MUS,MCS --comms-log 1', '--parallel MUS,MUS,MCS,MCSonly --comms-log 1', '--parallel MUS,MCS --comms-log 1 --comms-ignore'],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --map-solver minicard
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--map-solver minicard', '-b MCSes --map-solver minicard', '--map-solver minicard --force-minisat', '--map-solver minicard --parallel MUS,MCS', '--map-solver minicard --prefetch-seeds'],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --harvest-seeds
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--force-minisat --harvest-seeds 1000', '--improved-implies --harvest-seeds 1000', '--force-minisat --shrink-algo dichotomic --harvest-seeds 1000', '--force-minisat --harvest-seeds 1000 --parallel MUS,MCS'],
+      'flags_all': common_flags,
+      'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
+      'default': True,
+    },
 ]
 if muser_available:
     jobs.extend([
@@ -73,7 +178,7 @@ if muser_available:
         {
         'name':    'marco_py',
         'files':   reg_files,
-        'flags':   ['--pmuser 2'],
+        'flags':   ['--pmuser 2', '--adaptive-shrink', '--shrink-jobs 3', '--shrink-jobs 2 --adaptive-shrink'],
         'flags_all': common_flags,
         'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
         'default': True,
@@ -1,5 +1,9 @@
 """Utility class(es) for marco_py"""
+import array
 from collections import Counter, defaultdict
+import functools
+from itertools import compress
+import operator
 import os
 import subprocess
 import threading
@@ -18,39 +22,274 @@ _get_time = time.time   # wall-time
 #_get_time = lambda: sum(os.times()[:4])  # combined user/sys time for this process and its children
 
 
-def synchronize_class(sync_class):
-    """Make any class [somewhat] thread-safe by acquiring an
-    object-wide lock on every method call.  Note: this will
-    *not* protect access to non-method attributes.
+def synchronize_class(sync_class, exclude=()):
+    """Make a [somewhat] thread-safe version of a class: a subclass whose
+    objects each acquire their own lock on every method call.  Note: this
+    will *not* protect access to non-method attributes.
+
+    Methods named in exclude are left unsynchronized (e.g., ones that are
+    thread-safe already and shouldn't wait for a long-running call).  If an
+    object has a stats attribute (a Statistics), any time a call spends
+    waiting for the lock is recorded there as a 'lock_wait' stat.
 
     Based on: http://theorangeduck.com/page/synchronized-python
     """
-    lock = threading.RLock()
-
     def decorator(func):
-        def wrapper(*args, **kwargs):
-            with lock:
-                return func(*args, **kwargs)
+        def wrapper(self, *args, **kwargs):
+            lock = self.__lock__
+            if not lock.acquire(False):
+                start = _get_time()
+                lock.acquire()
+                stats = getattr(self, 'stats', None)
+                if stats is not None:
+                    stats.add_stat('lock_wait', _get_time() - start)
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                lock.release()
         return wrapper
 
-    orig_init = sync_class.__init__
-
     def __init__(self, *args, **kwargs):
-        self.__lock__ = lock          # not used by this code, but could be useful
+        self.__lock__ = threading.RLock()
         self.__synchronized__ = True  # a flag to check in assertions
-        orig_init(self, *args, **kwargs)
-
-    sync_class.__init__ = __init__
+        sync_class.__init__(self, *args, **kwargs)
 
+    methods = {'__init__': __init__}
     for key in dir(sync_class):
         val = getattr(sync_class, key)
         # synchronize all methods except __init__ (no other thread
         # can have a reference to an object before __init__ complete,
         # as far as I know)
-        if isinstance(val, (types.MethodType, types.FunctionType)) and key != '__init__':
-            setattr(sync_class, key, decorator(val))
+        if isinstance(val, (types.MethodType, types.FunctionType)) and key != '__init__' and key not in exclude:
+            methods[key] = decorator(val)
+
+    return type(sync_class.__name__, (sync_class,), methods)
+
+
+# translate() table swapping 0 and 1 bytes (for Bitset.complement())
+_FLIP = bytes(bytearray([1, 0] + [0] * 254))
 
-    return sync_class
+
+class Bitset(object):
+    """A set of constraint indexes from 1 to n, stored as a mask with one
+    byte (0 or 1) per index.
+
+    Taking the complement of a set, iterating over it, and turning it into
+    solver literals each take a single C-level call on the mask (translate()
+    or itertools.compress()) rather than building sets of Python ints.
+    Members iterate in increasing order.
+
+    >>> s = Bitset(6, [5, 2, 3])
+    >>> list(s), len(s), 3 in s, 4 in s
+    ([2, 3, 5], 3, True, False)
+    >>> list(s.complement())
+    [1, 4, 6]
+    >>> s.to_array(offset=10).tolist(), s.to_array(negate=True).tolist()
+    ([12, 13, 15], [-2, -3, -5])
+    """
+    __slots__ = ('mask',)
+
+    def __init__(self, n, members=()):
+        mask = bytearray(n + 1)  # (index 0 is unused)
+        for i in members:
+            mask[i] = 1
+        self.mask = mask
+
+    @classmethod
+    def from_seed(cls, n, seed):
+        """Return a seed (any iterable of indexes) as a Bitset, or the seed
+        itself if it is one already."""
+        if isinstance(seed, cls):
+            return seed
+        return cls(n, seed)
+
+    @property
+    def n(self):
+        return len(self.mask) - 1
+
+    def __len__(self):
+        return self.mask.count(b'\x01')
+
+    def __iter__(self):
+        return compress(range(len(self.mask)), self.mask)
+
+    def __contains__(self, i):
+        return 0 < i < len(self.mask) and self.mask[i] == 1
+
+    def __eq__(self, other):
+        return isinstance(other, Bitset) and self.mask == other.mask
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(bytes(self.mask))
+
+    def __repr__(self):
+        return "Bitset(%d, %s)" % (self.n, list(self))
+
+    # (explicit state, as __slots__ classes need it to be pickled in Python 2)
+    def __getstate__(self):
+        return self.mask
+
+    def __setstate__(self, mask):
+        self.mask = mask
+
+    def complement(self):
+        """Return the complement of this set w.r.t. 1..n."""
+        ret = Bitset.__new__(Bitset)
+        ret.mask = self.mask.translate(_FLIP)
+        ret.mask[0] = 0
+        return ret
+
+    def to_array(self, offset=0, negate=False):
+        """Return the members as an array of C ints, each plus offset and
+        then negated if negate is True (e.g., to get solver literals)."""
+        size = len(self.mask)
+        if negate:
+            indexes = range(-offset, -offset - size, -1)
+        else:
+            indexes = range(offset, offset + size)
+        return array.array('i', compress(indexes, self.mask))
+
+
+class SubsetIndex(object):
+    """Sets of constraints indexed for finding one that is a subset of a
+    given set.  Each set added gets a slot number, and for each constraint,
+    the index keeps a bitmask (a Python int) of the slots of the sets
+    containing it; a lookup ORs together the bitmasks for the constraints
+    outside the given set, skipping any in no set, to find a set avoiding
+    them all -- a single pass at C speed, usually over few constraints.
+    Slots freed by remove() are reused.
+
+    >>> index = SubsetIndex(5)
+    >>> a, b = index.add([1, 2]), index.add([2, 4])
+    >>> outside = Bitset(5, [1, 2, 3]).complement().mask
+    >>> index.find_subset(outside) == a
+    True
+    >>> index.remove(a, [1, 2])
+    >>> index.find_subset(outside), index.add([3]) == a, index.has_subset(outside)
+    (None, True, True)
+    """
+    def __init__(self, n):
+        self._sets_with = [0] * (n + 1)  # per constraint: bitmask of the slots of the sets containing it
+        self._in_members = bytearray(n + 1)
+        self._members = []  # constraints in any set (so far)
+        self._slots = 0  # slots used so far
+        self._free = []  # slots freed by remove()
+        self._used = 0  # bitmask of the slots in use
+
+    def add(self, members):
+        """Add a set (an iterable of constraints), returning its slot."""
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = self._slots
+            self._slots += 1
+        bit = 1 << slot
+        self._used |= bit
+        for i in members:
+            if not self._in_members[i]:
+                self._in_members[i] = 1
+                self._members.append(i)
+            self._sets_with[i] |= bit
+        return slot
+
+    def remove(self, slot, members):
+        """Remove the set in a given slot, with the given members."""
+        mask = ~(1 << slot)
+        self._used &= mask
+        for i in members:
+            self._sets_with[i] &= mask
+        self._free.append(slot)
+
+    def find_subset(self, outside):
+        """Find a set disjoint from the constraints i with outside[i] == 1
+        (e.g., the mask of a Bitset's complement), returning its slot (the
+        lowest, if several are), or None if there is none."""
+        members = self._members
+        hit = functools.reduce(operator.or_, map(self._sets_with.__getitem__, compress(members, map(outside.__getitem__, members))), 0)
+        found = self._used & ~hit
+        if not found:
+            return None
+        return (found & -found).bit_length() - 1
+
+    def has_subset(self, outside):
+        """Is any set disjoint from the constraints i with outside[i] == 1?"""
+        return self.find_subset(outside) is not None
+
+
+def dichotomic_shrink(seed, hard, check, get_core, critical=None):
+    """Shrink an unsatisfiable seed to an MUS by deleting chunks of
+    constraints at a time (divide-and-conquer, in the style of QuickXplain).
+    Starting with chunks of half the seed, each chunk is removed if the rest
+    is still unsatisfiable; then the chunk size is halved, until a final pass
+    with single constraints.  As in linear deletion, every unsatisfiable check
+    reduces the current set to the core found, and a constraint whose removal
+    is satisfiable is kept as necessary.  When the MUS is small relative to
+    the seed, this needs only a logarithmic number of checks per constraint
+    in the MUS.
+
+    Args:
+        seed: An iterable of constraints forming an unsatisfiable set.
+        hard: Constraints known to be in every MUS within the seed (never
+              tested for removal).
+        check: A function returning True if a given set of constraints is
+               satisfiable.
+        get_core: A function returning an unsat core (a subset of the last
+                  set given to check(), which must have been unsatisfiable).
+        critical: An optional function called after each satisfiable check
+                  as critical(current, removed), with removed the chunk left
+                  out of current for the check, returning any constraints
+                  thereby proven to be in every MUS within current (e.g., by
+                  model rotation).
+
+    Returns:
+        A set of constraints forming an MUS.
+
+    >>> checks = []
+    >>> def check(s):
+    ...     checks.append(s)
+    ...     return not {3, 11, 12} <= s
+    >>> sorted(dichotomic_shrink(range(1, 65), [], check, lambda: checks[-1]))
+    [3, 11, 12]
+    >>> len(checks)
+    18
+    >>> sorted(dichotomic_shrink(range(1, 65), [11], check, lambda: checks[-1]))
+    [3, 11, 12]
+    """
+    seed = list(seed)
+    current = set(seed)
+    necessary = set(x for x in hard if x in current)
+    chunk = max(1, (len(current) - len(necessary)) // 2)
+
+    while True:
+        # keep the seed's order for the remaining candidates
+        candidates = [x for x in seed if x in current and x not in necessary]
+        if not candidates:
+            break
+        chunk = min(chunk, len(candidates))
+
+        for start in range(0, len(candidates), chunk):
+            part = [x for x in candidates[start:start+chunk] if x in current]
+            if not part:
+                # already removed by an earlier core
+                continue
+            trial = current.difference(part)
+            if check(trial):
+                if len(part) == 1:
+                    necessary.add(part[0])
+                if critical is not None:
+                    necessary.update(critical(current, part))
+            else:
+                # Remove the chunk and any also-removed constraints
+                current = set(get_core())
+
+        if chunk == 1:
+            break
+        chunk //= 2
+
+    return current
 
 
 class ExecutableException(Exception):
@@ -120,6 +359,21 @@ class Statistics(object):
         self._counts = Counter()
         self._stats = defaultdict(list)
         self._active_timers = {}   # dict: key=category, value=start time
+        self._lock = threading.Lock()  # (e.g., a seed prefetch thread may count things, too)
+
+    # (pickled to send a child's stats to the master in parallel mode)
+    def __getstate__(self):
+        with self._lock:
+            state = dict(self.__dict__)
+            for name in ('_times', '_counts', '_active_timers'):
+                state[name] = state[name].copy()
+            state['_stats'] = defaultdict(list, ((name, list(values)) for name, values in self._stats.items()))
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
 
     def time(self, category):
         return self.TimerContext(self, category)
@@ -138,18 +392,25 @@ class Statistics(object):
             return False  # doesn't handle any exceptions itself
 
     def increment_counter(self, category):
-        self._counts[category] += 1
+        with self._lock:
+            self._counts[category] += 1
 
     def start_time(self, category):
-        assert category not in self._active_timers
-        self.increment_counter(category)
-        self._active_timers[category] = _get_time()
+        with self._lock:
+            assert category not in self._active_timers
+            self._counts[category] += 1
+            self._active_timers[category] = _get_time()
 
     def end_time(self, category):
-        self.update_time(category)
-        del self._active_timers[category]
+        with self._lock:
+            self._update_time(category)
+            del self._active_timers[category]
 
     def update_time(self, category):
+        with self._lock:
+            self._update_time(category)
+
+    def _update_time(self, category):
         now = _get_time()
         self._times[category] += now - self._active_timers[category]
         # reset the "start time" as previous time is now counted
@@ -159,19 +420,23 @@ class Statistics(object):
         return _get_time() - self._start
 
     def get_times(self):
-        self._times['total'] = self.total_time()
-        for category in self._active_timers:
-            # If any timers are currently running,
-            # give them the time up to this point.
-            self.update_time(category)
+        with self._lock:
+            self._times['total'] = self.total_time()
+            for category in self._active_timers:
+                # If any timers are currently running,
+                # give them the time up to this point.
+                self._update_time(category)
 
-        return self._times
+            return Counter(self._times)
 
     def get_counts(self):
-        return self._counts
+        with self._lock:
+            return Counter(self._counts)
 
     def add_stat(self, name, value):
-        self._stats[name].append(value)
+        with self._lock:
+            self._stats[name].append(value)
 
     def get_stats(self):
-        return self._stats
+        with self._lock:
+            return defaultdict(list, ((name, list(values)) for name, values in self._stats.items()))